@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+from multiprocessing.pool import ThreadPool
+
+import PatientModelEpilepsy
+
+INDEX_VERSION = 1
+INDEX_FILENAME = 'patients_index.json'
+VOLUME_EXTENSIONS = '.nii', '.nii.gz'
+TRANSFORM_EXTENSIONS = '.xfm', '.tfm'
+
+
+def getPatientStatus(model):
+    """
+    Scans the directory of a patient and returns a JSON-serializable summary of its files
+
+    :param model: PatientModelEpilepsy
+    """
+    manifest = model.getManifest(refresh=True)
+    artifacts = {}
+    for name in model.getArtifactNames():
+        entry = manifest.getEntry(name)
+        if entry['exists']:
+            artifacts[name] = entry['size'], entry['mtime']
+    paths = dict((name, getattr(model, name)) for name in artifacts)
+    status = {'id': model.idString,
+              'directoryMTimes': manifest.directoryMTimes,
+              'artifacts': artifacts,
+              'volumes': sorted(name for name in artifacts if paths[name].endswith(VOLUME_EXTENSIONS)),
+              'transforms': sorted(name for name in artifacts if paths[name].endswith(TRANSFORM_EXTENSIONS)),
+              'electrodesXML': 'xmlPath' in artifacts,
+              'verifiedXML': 'xmlVerifiedPath' in artifacts,
+              'localizationsCSV': 'localizationsPath' in artifacts}
+    return status
+
+
+def isStatusOutdated(status):
+    """
+    Returns True if any directory scanned to build the status has been modified since
+    """
+    if not status.get('directoryMTimes'):
+        return True
+    for directory, mtime in status['directoryMTimes'].items():
+        try:
+            if os.stat(directory).st_mtime != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+
+class CohortScanner:
+    """
+    Builds an index of the files of every patient in a patients directory.
+    Patients are scanned in parallel and, when the index already exists, only
+    the patients whose directories have been modified are scanned again.
+    """
+
+    def __init__(self, patientsDir, indexPath=None, numThreads=8):
+        """
+        :param patientsDir: directory containing one folder per patient
+        :param indexPath: path of the JSON index file. Defaults to a file in patientsDir
+        :param numThreads: number of threads used to scan the patients
+        """
+        self.patientsDir = patientsDir
+        if indexPath is None:
+            indexPath = os.path.join(patientsDir, INDEX_FILENAME)
+        self.indexPath = indexPath
+        self.numThreads = numThreads
+        self.patients = {}
+        self.readIndex()
+
+
+    def readIndex(self):
+        try:
+            with open(self.indexPath) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION and index.get('patientsDir') == self.patientsDir:
+            self.patients = index['patients']
+
+
+    def writeIndex(self):
+        index = {'version': INDEX_VERSION,
+                 'patientsDir': self.patientsDir,
+                 'patients': self.patients}
+        tempPath = self.indexPath + '.tmp'
+        with open(tempPath, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        if os.path.exists(self.indexPath):
+            os.remove(self.indexPath)  # os.rename does not overwrite on Windows
+        os.rename(tempPath, self.indexPath)
+
+
+    def getPatientIds(self):
+        return sorted(name for name, path, isDirectory, stat
+                      in PatientModelEpilepsy.scanDirectory(self.patientsDir)
+                      if isDirectory)
+
+
+    def scanPatient(self, patientId):
+        """
+        Returns the status of a patient and whether it had to be scanned again
+        """
+        status = self.patients.get(patientId)
+        if status is not None and not isStatusOutdated(status):
+            return status, False
+        model = PatientModelEpilepsy.PatientModelEpilepsy(patientId, rootDir=self.patientsDir)
+        return getPatientStatus(model), True
+
+
+    def scan(self, write=True):
+        """
+        Updates the index with the current state of the patients directory
+
+        :param write: write the index file after the scan
+        :returns: list of IDs of the patients that were scanned again
+        """
+        patientIds = self.getPatientIds()
+        pool = ThreadPool(self.numThreads)
+        try:
+            results = pool.map(self.scanPatient, patientIds)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.patients = {}
+        rescanned = []
+        for patientId, (status, isNew) in zip(patientIds, results):
+            self.patients[patientId] = status
+            if isNew:
+                rescanned.append(patientId)
+
+        if write:
+            self.writeIndex()
+        return rescanned
+
+
+    def getPatientsWith(self, *artifactNames):
+        """
+        Returns the IDs of the patients that have all the given files
+
+        :param artifactNames: attribute names of PatientModelEpilepsy, such as 'xmlPath'
+        """
+        return sorted(patientId for patientId, status in self.patients.items()
+                      if all(name in status['artifacts'] for name in artifactNames))
+
+
+
+if __name__ == '__main__':
+    scanner = CohortScanner(sys.argv[1])
+    rescanned = scanner.scan()
+    print('%d patients, %d scanned' % (len(scanner.patients), len(rescanned)))
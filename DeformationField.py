@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+import ImageUtils
+
+
+class DeformationField:
+    """
+    SPM-style deformation field: an image whose voxels hold, for each position in
+    the space of the image, the corresponding coordinates in another space (e.g. MNI).
+    Uncompressed fields are memory-mapped, so warping a few points reads only a few pages.
+    """
+
+    # Fields keyed by path, shared by all the patients of a session
+    fields = {}
+
+    def __init__(self, fieldPath):
+        self.fieldPath = fieldPath
+        self.mtime = os.path.getmtime(fieldPath)
+        if fieldPath.endswith('.nii'):
+            data, self.affine, (slope, intercept) = ImageUtils.memmapNifti(fieldPath)
+            if not np.isfinite(slope) or slope == 0:
+                slope = 1  # the NIfTI standard says the data are not scaled
+                intercept = 0
+            if slope != 1 or intercept:
+                data = data * slope + intercept
+        else:
+            data, self.affine = ImageUtils.readImageArray(fieldPath)
+        # SPM stores the three components along the fifth dimension: (i, j, k, 1, 3)
+        self.data = data.reshape(data.shape[:3] + (-1,), order='F')
+        self.worldToVoxelMatrix = np.linalg.inv(self.affine)
+
+
+    def __repr__(self):
+        return 'Deformation field %s %s' % (os.path.basename(self.fieldPath), self.data.shape[:3])
+
+
+    @classmethod
+    def get(cls, fieldPath):
+        """
+        Returns the field read from fieldPath, reading it again only if the file has been modified
+        """
+        field = cls.fields.get(fieldPath)
+        if field is None or field.mtime != os.path.getmtime(fieldPath):
+            field = cls.fields[fieldPath] = cls(fieldPath)
+        return field
+
+
+    def warpPoints(self, points, affine=None):
+        """
+        Maps points to the space of the values of the field with trilinear interpolation
+
+        :param points: (N, 3) array of RAS points
+        :param affine: 4x4 matrix taking the points to the space of the field image, e.g. the inverse
+        of the registration to ACPC if the points are in ACPC space
+        :returns: (N, 3) array of warped points. Points outside the field get NaN.
+        """
+        points = np.asarray(points, np.float64)
+        if affine is not None:
+            points = ImageUtils.applyAffine(points, affine)
+        voxels = ImageUtils.applyAffine(points, self.worldToVoxelMatrix)
+        return ImageUtils.interpolateTrilinear(self.data, voxels)
@@ -14,6 +14,7 @@ def isSlicerPython():
 
 if isSlicerPython():
     import qt
+    import ctk
     import vtk
     import slicer
     import MeshUtils as mu
@@ -24,21 +25,84 @@ DISTANCE_TO_LABEL = 20  # mm
 SPHERE_RADIUS = .8 # mm
 CENTER = 0x84  # http://doc.qt.io/qt-4.8/qt.html#AlignmentFlag-enum
 ATLASES = [const.TALAIRACH, const.AAL, const.YEO]
+REFORMAT_TYPES = const.SLICE_TYPE_AXIAL, const.SLICE_TYPE_SAGITTAL, const.SLICE_TYPE_CORONAL
+LABELS_PLACEHOLDER = 'Computing labels...'
+NO_LABELS = 'No labels found for this plot'
+
+
+def formatTalairachLabels(labels):
+    if labels is None:
+        return NO_LABELS
+    labels = list(labels)  # the cached labels must not be modified
+    if set(labels) == {'*'}:
+        labels[:2] = labels[3:] = ['', '']
+        labels[2] = 'Plot outside the atlas'
+        # return 'None (plot outside the Talairach Daemon atlas)'
+    return '\n'.join(labels)
+    # return '.'.join(labels)
 
 
 class Electrode:
 
-    def __init__(self, name, colorString=None, plots=[]):
+    def __init__(self, name, colorString=None, plots=None):
         self.name = name
         self.colorString = colorString
-        self.plots = plots
         self.button = None
+        self.labels = None
+        self.probeEyeStack = None
+        self.setPlots([] if plots is None else plots)
 
 
     def __repr__(self):
         return 'Epilepsy electrode %s (%d plots)' % (self.name, len(self.plots))
 
 
+    def setPlots(self, plots):
+        """
+        Stores the centers of the plots in one contiguous (N, 3) float64 array.
+        The plots become views over the rows of this array.
+
+        :param plots: list of EpilepsyPlot
+        """
+        centers = np.empty((len(plots), 3), np.float64)
+        for i, plot in enumerate(plots):
+            centers[i] = np.nan if plot.center is None else plot.center
+        self.centers = centers
+        self.plotNumbers = np.array([int(plot.number) for plot in plots], int)
+        for i, plot in enumerate(plots):
+            plot.bind(self, i)
+        self.plots = plots
+        self.invalidateGeometry()
+
+
+    def invalidateGeometry(self):
+        """
+        Discards the cached geometry. Must be called whenever the plots centers change.
+        """
+        self.geometry = {}
+
+
+    def getCachedGeometry(self, key, compute):
+        if key not in self.geometry:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self.geometry[key] = value
+        return self.geometry[key]
+
+
+    def transformCenters(self, matrix):
+        """
+        Applies an affine matrix to the centers of all the plots
+
+        :param matrix: 4x4 affine matrix
+        """
+        rot = matrix[:3, :3]
+        trans = matrix[:3, 3]
+        self.centers[:] = np.dot(self.centers, rot.T) + trans
+        self.invalidateGeometry()
+
+
     def makeAndLoadModels(self):
         plotsPolydata = self.getPlotsPolyData(asSpheres=True)
         scene = slicer.mrmlScene
@@ -56,66 +120,50 @@ class Electrode:
         model.SetName(self.name + '_plots')
         self.plotsModel = model
 
-        self.displayElectrodeFiducials()
-
-
-    def displayElectrodeFiducials(self):
-        import EpilocVisualization
-        logic = EpilocVisualization.EpilocVisualizationLogic()
-
-        labelPoint = self.getEntryPoint() - DISTANCE_TO_LABEL * self.getDirection()
-        labelNode, labelDisplayNode = logic.getMarkupsFiducialNode(name=self.name + '_label',
-                                                                   color=self.getColorTupleFloat(),
-                                                                   glyphScale=0,
-                                                                   textScale=4)
-        n = labelNode.AddFiducialFromArray(labelPoint)
-        labelNode.SetNthFiducialSelected(n, 0)
-        labelNode.SetNthFiducialLabel(n, self.name)
-
-        self.markupLabelNode = labelNode
-        self.markupLabelDisplayNode = labelDisplayNode
 
+    def getColorTupleFloat(self):
 
-        markupPlotsNode, markupPlotsDisplayNode = logic.getMarkupsFiducialNode(name=self.name + '_plots',
-                                                                               color=self.getColorTupleFloat(),
-                                                                               selectedColor=self.getColorTupleFloat(),
-                                                                               labelFormat='%d',
-                                                                               glyphScale=0,
-                                                                               textScale=3)
+        return map(float, self.colorString.split())
 
-        for plot in self.plots:
-              n = markupPlotsNode.AddFiducialFromArray(plot.center)
-              markupPlotsNode.SetNthFiducialSelected(n, 0)
 
-        self.markupPlotsNode = markupPlotsNode
-        self.markupPlotsDisplayNode = markupPlotsDisplayNode
+    def getDirection(self):
 
+        return self.getCachedGeometry('direction', self.computeDirection)
 
-    def getColorTupleFloat(self):
 
-        return map(float, self.colorString.split())
+    def getValidCenters(self):
+        """
+        Returns the centers of the plots whose position is known. The centers of the plots
+        that could not be moved to the space of the scene are NaN.
+        """
+        return self.getCachedGeometry('validCenters', lambda: self.centers[np.isfinite(self.centers).all(axis=1)])
 
 
-    def getDirection(self):
-        if len(self.plots) >= 2:
-            targetPoint = self.plots[0].center
-            entryPoint = self.plots[-1].center
+    def computeDirection(self):
+        if len(self.getValidCenters()) >= 2:
+            targetPoint = self.getTargetPoint()
+            entryPoint = self.getEntryPoint()
             diff = targetPoint - entryPoint
             return diff / np.linalg.norm(diff)
 
 
     def getLength(self, screw=False):
-        if len(self.plots) >= 2:
-            targetPoint = self.plots[0].center
-            entryPoint = self.plots[-1].center
-            diff = targetPoint - entryPoint
-            plotsLength = np.linalg.norm(diff)
+        plotsLength = self.getCachedGeometry('length', self.computeLength)
+        if plotsLength is not None:
             if screw:
                 return plotsLength + SCREW_LENGTH
             else:
                 return plotsLength
 
 
+    def computeLength(self):
+        if len(self.getValidCenters()) >= 2:
+            targetPoint = self.getTargetPoint()
+            entryPoint = self.getEntryPoint()
+            diff = targetPoint - entryPoint
+            return np.linalg.norm(diff)
+
+
     def getElectrodeSliceReformatTransform(self, sliceType, offset=0, centerOnPlot=1):
         """
         Returns an AffineMatrix to reformat volume slices with respect to the trajectory direction
@@ -123,17 +171,44 @@ class Electrode:
         :param offset: offset used to move the center of the slice
         :param ctPost2ACPCAffine: AffineMatrix mapping from ctpost to the ACPC space
         """
+        if not offset or sliceType != const.SLICE_TYPE_AXIAL:
+            return self.getReformatFrames()[centerOnPlot - 1, REFORMAT_TYPES.index(sliceType)]
 
         direction = self.getDirection()
-        center = self.plots[centerOnPlot - 1].center
+        center = self.centers[centerOnPlot - 1]
 
         if sliceType != const.SLICE_TYPE_AXIAL:
-            distanceBetweenPlotAndTarget = np.linalg.norm(self.plots[centerOnPlot-1].center - self.plots[0].center)
+            distanceBetweenPlotAndTarget = np.linalg.norm(self.centers[centerOnPlot-1] - self.centers[0])
             offset = self.getLength(screw=True) / 2 - distanceBetweenPlotAndTarget  # target point on first 1/5 of the slice view
 
         return self.getSliceReformatTransform(center, -direction, offset, sliceType)
 
 
+    def getReformatFrames(self):
+        """
+        Returns the axial, sagittal and coronal reformat frames centered on every plot,
+        as a (P, 3, 4, 4) array indexed by plot index and REFORMAT_TYPES. The frames are
+        cached until the plots centers change.
+        """
+        return self.getCachedGeometry('reformatFrames', self.computeReformatFrames)
+
+
+    def computeReformatFrames(self):
+        direction = -self.getDirection()
+        distancesToTarget = np.linalg.norm(self.centers - self.getTargetPoint(), axis=1)
+        offsets = self.getLength(screw=True) / 2 - distancesToTarget  # target point on first 1/5 of the slice view
+
+        frames = np.tile(np.identity(4), (len(self.centers), len(REFORMAT_TYPES), 1, 1))
+        for i, reformatType in enumerate(REFORMAT_TYPES):
+            rotation = self.getSliceReformatTransform(np.zeros(3), direction, 0, reformatType)[:3, :3]
+            frames[:, i, :3, :3] = rotation
+            if reformatType == const.SLICE_TYPE_AXIAL:
+                frames[:, i, :3, 3] = self.centers
+            else:
+                frames[:, i, :3, 3] = self.centers + direction * offsets[:, np.newaxis]
+        return frames
+
+
     def getSliceReformatTransform(self, center, direction, offset, reformatType, yAxis=None):
         """
         Calculates a transformation to reformat a volume in axial, coronal and sagittal slices with respect to a given direction.
@@ -172,14 +247,10 @@ class Electrode:
 
 
     def getPlotsPolyData(self, asSpheres=False):
-        polyDataList = []
         if asSpheres:
-            for plot in self.plots:
-                spherePolyData = mu.getSpherePolyData(plot.center, SPHERE_RADIUS)
-                polyDataList.append(spherePolyData)
+            return mu.getSpheresPolyData(self.getValidCenters(), SPHERE_RADIUS)
         else:
-            pass
-        return mu.mergePolyData(polyDataList)
+            return mu.mergePolyData([])
 
         # self.directionsBetweenPlots = []
         # params = self.params
@@ -218,32 +289,12 @@ class Electrode:
         :param fieldOfView: field-of-view (optional)
         """
 
-        def getSliceNodeByColor(scene,sliceColor):
-            """
-            Return the MRLML slice node for the given orientation string.
-
-            :param scene: Slicer scene
-            :param sliceColor: slice color like in const.SLICE_COLOR_XXX
-            """
-            nodes = scene.GetNodesByClass('vtkMRMLSliceNode')
-            for idx in range(nodes.GetNumberOfItems()):
-                node = nodes.GetItemAsObject(idx)
-                if node.GetName() == sliceColor:
-                    return node
-            return None
-
-
-        def getVTK4x4Matrix(matrix):
-            vtkMatrix = vtk.vtkMatrix4x4()
-            for row in xrange(4):
-                for col in xrange(4):
-                    vtkMatrix.SetElement(row, col, matrix[row,col])
-            return vtkMatrix
-
-        node = getSliceNodeByColor(scene,sliceColor)
+        import EpilocVisualization
+        logic = EpilocVisualization.getLogic()
+        node = logic.getSliceNodeByColor(scene,sliceColor)
         if node is not None:
             modifyId = node.StartModify()
-            node.SetSliceToRAS(getVTK4x4Matrix(affine))
+            node.SetSliceToRAS(logic.getVTK4x4Matrix(affine))
             if fieldOfView is not None:
                 dimX,dimY,_dimZ = node.GetDimensions()
                 fieldOfViewX = fieldOfView[1]*dimX/float(dimY)
@@ -256,15 +307,8 @@ class Electrode:
 
 
     def showOnlyThis(self):
-        markupsInScene = slicer.util.getNodes('vtkMRMLMarkupsFiducialNode*')
-        for name, node in markupsInScene.items():
-            displayNode = node.GetDisplayNode()
-            displayNode.SetVisibility(self.name in name)
-
         epilocWidget = slicer.modules.EpilocVisualizationWidget
-        for electrode in epilocWidget.electrodes:
-            if hasattr(electrode, 'plotsModel'):
-                electrode.plotsModel.GetDisplayNode().SetVisibility(electrode is self)
+        epilocWidget.electrodesRegistry.showOnly(self)
 
 
     def showOnlyThisPlotsGroupBox(self):
@@ -274,16 +318,18 @@ class Electrode:
 
 
     def show(self):
-        markupsInScene = slicer.util.getNodes('vtkMRMLMarkupsFiducialNode*')
-        for name, node in markupsInScene.items():
-            displayNode = node.GetDisplayNode()
-            if self.name in name:
-                displayNode.SetVisibility(True)
-        if hasattr(self, 'plotsModel'):
-            self.plotsModel.GetDisplayNode().SetVisibility(True)
+        epilocWidget = slicer.modules.EpilocVisualizationWidget
+        epilocWidget.electrodesRegistry.show([self])
 
 
     def getCenter(self, screw=False):
+
+        return self.getCachedGeometry('center', self.computeCenter)
+
+
+    def computeCenter(self):
+        if not len(self.getValidCenters()):
+            return None
         extremes = self.getEntryPoint(), self.getTargetPoint()
         center = np.mean(extremes, axis=0)
         return center
@@ -291,9 +337,10 @@ class Electrode:
 
     def center3DView(self):
         import EpilocVisualization
-        logic = EpilocVisualization.EpilocVisualizationLogic()
+        logic = EpilocVisualization.getLogic()
         electrodeCenter = self.getCenter()
-        logic.center3DView(electrodeCenter)
+        if electrodeCenter is not None:
+            logic.center3DView(electrodeCenter)
 
 
     def getElectrodeButton(self):
@@ -329,6 +376,19 @@ class Electrode:
         spinBoxLayout.addStretch()
         self.plotsGroupBox.layout().addLayout(spinBoxLayout)
 
+        depthLayout = qt.QHBoxLayout()
+        depthLayout.addWidget(qt.QLabel('Depth:'))
+        self.depthSlider = ctk.ctkSliderWidget()
+        self.depthSlider.setToolTip('Distance from the target point of the axial slice in reformat mode')
+        self.depthSlider.decimals = 1
+        self.depthSlider.singleStep = 0.1
+        self.depthSlider.minimum = 0
+        self.depthSlider.maximum = self.getLength(screw=True) or 0
+        self.depthSlider.suffix = ' mm'
+        self.depthSlider.valueChanged.connect(self.onDepthSlider)
+        depthLayout.addWidget(self.depthSlider)
+        self.plotsGroupBox.layout().addLayout(depthLayout)
+
         self.plotsGroupBox.layout().addStretch()
 
         anatomicalLabelLayout = qt.QHBoxLayout()
@@ -356,13 +416,15 @@ class Electrode:
 
 
     def getTargetPoint(self):
-
-        return self.plots[0].center
+        validCenters = self.getValidCenters()
+        if len(validCenters):
+            return validCenters[0]
 
 
     def getEntryPoint(self):
-
-        return self.plots[-1].center
+        validCenters = self.getValidCenters()
+        if len(validCenters):
+            return validCenters[-1]
 
 
     def hideWidgets(self):
@@ -371,66 +433,134 @@ class Electrode:
 
 
     def getFieldOfView(self, screw=True):
+
+        return self.getCachedGeometry(('fieldOfView', screw), lambda: self.computeFieldOfView(screw))
+
+
+    def computeFieldOfView(self, screw):
         fov = [self.getLength(screw=screw) / 3 * 5] * 3 # plots + screw occupy 3/5 of the slice view
         return fov
 
 
     def reformatSlices(self):
-        plotNumber = self.plotsSpinBox.value
-
+        """
+        Aligns the slices with the electrode, the axial slice being at the depth of the depth slider.
+        The axial slice shows the probe's eye stack of the electrode once it has been computed,
+        and the postoperative volume resliced by Slicer until then.
+        """
         colors = const.SLICE_COLOR_AXIAL, const.SLICE_COLOR_SAGITTAL, const.SLICE_COLOR_CORONAL
-        types = const.SLICE_TYPE_AXIAL, const.SLICE_TYPE_SAGITTAL, const.SLICE_TYPE_CORONAL
 
+        if self.getDirection() is None:
+            return  # the trajectory is unknown
+
+        depth = self.depthSlider.value
         scene = slicer.mrmlScene
         fieldOfView = self.getFieldOfView()
+        frames = self.getDepthFrames(depth)
 
-        for color, type in zip(colors, types):
-            self.setSliceToRASToMatrix(scene, color, self.getElectrodeSliceReformatTransform(type, centerOnPlot=plotNumber), fieldOfView=fieldOfView)
+        for color, frame in zip(colors, frames):
+            self.setSliceToRASToMatrix(scene, color, frame, fieldOfView=fieldOfView)
+
+        import EpilocVisualization
+        logic = EpilocVisualization.getLogic()
+        epilocWidget = slicer.modules.EpilocVisualizationWidget
+        bgVolumeNode = epilocWidget.bgSelector.currentNode()
+        image = self.getProbeEyeSlice(depth)
+        if image is None:
+            logic.showProbeEyeSlice(None, bgVolumeNode=bgVolumeNode)
+        else:
+            logic.showProbeEyeSlice(image, self.probeEyeStack.getSliceIJKToRAS(depth), bgVolumeNode)
+
+
+    def getDepthFrames(self, depth):
+        """
+        Returns the axial, sagittal and coronal reformat frames with the axial slice
+        at a distance from the target point. The sagittal and coronal frames do not depend on the depth.
+
+        :param depth: distance in mm
+        """
+        frames = self.getReformatFrames()[0].copy()
+        axial = REFORMAT_TYPES.index(const.SLICE_TYPE_AXIAL)
+        frames[axial, :3, 3] = self.getTargetPoint() - depth * self.getDirection()
+        return frames
 
 
     def jumpSlices(self):
         plotNumber = self.plotsSpinBox.value
-        point = self.plots[plotNumber - 1].center
+        point = self.centers[plotNumber - 1]
+        if not np.isfinite(point).all():
+            return  # the position of the plot is unknown
 
         import EpilocVisualization
-        logic = EpilocVisualization.EpilocVisualizationLogic()
+        logic = EpilocVisualization.getLogic()
         logic.centerSlices(point)
 
 
     def getPlotCenter(self, plotNumber):
 
-        return self.plots[plotNumber - 1].center
+        return self.centers[plotNumber - 1]
+
+
+    def getProbeEyeSlice(self, distance):
+        """
+        Returns the slice perpendicular to the electrode at a distance in mm from the target point,
+        or None if the probe's eye stack of the electrode has not been computed yet
+        """
+        if self.probeEyeStack is None:
+            return None
+        return self.probeEyeStack.getSlice(distance)
+
+
+    def computeLabels(self, talairachIndex=None, atlasReader=None):
+        """
+        Fills the labels table of the electrode, with one label per plot for each atlas.
+        Talairach labels are taken from the localizations CSV index if available.
+        Atlases are only queried if an atlas reader is given, i.e. if the centers are in MNI space.
+
+        :param talairachIndex: index returned by ElectrodesReader.getTalairachIndex
+        :param atlasReader: atlaslabels.AtlasReader
+        """
+        labels = {}
+        if talairachIndex is not None:
+            labels[const.TALAIRACH] = [formatTalairachLabels(talairachIndex.get((self.name, number)))
+                                       for number in self.plotNumbers]
+        if atlasReader is not None:
+            for atlasName in ATLASES:
+                if atlasName not in labels:
+                    _, labels[atlasName] = atlasReader.getLabels(atlasName, self.centers)
+        self.labels = labels
+
+
+    def getLabelFromTable(self, atlasName, plotNumber):
+        if self.labels is None:
+            return LABELS_PLACEHOLDER
+        elif atlasName not in self.labels:
+            return NO_LABELS
+        else:
+            return self.labels[atlasName][plotNumber - 1]
 
 
     def getTalairachLabel(self, plotNumber=None):
         if plotNumber is None:
             plotNumber = self.plotsSpinBox.value
-        epilocWidget = slicer.modules.EpilocVisualizationWidget
-
-        # if not epilocWidget.mniScene:
-        csvPath = epilocWidget.model.localizationsPath
-        import ElectrodesIO
-        reader = ElectrodesIO.ElectrodesReader()
-        labels = reader.getTalairachLabelFromCSV(self.name, plotNumber, csvPath)
-        if set(labels) == {'*'}:
-            labels[:2] = labels[3:] = ['', '']
-            labels[2] = 'Plot outside the atlas'
-            # return 'None (plot outside the Talairach Daemon atlas)'
-        return '\n'.join(labels)
-        # return '.'.join(labels)
+        return self.getLabelFromTable(const.TALAIRACH, plotNumber)
 
         # else:
         #     ## TODO: calculate labels here (but we need to calculate MNI coords as well)
         #     label = epilocWidget.atlasReader.getTalairachLabel(self.getPlotCenter(plotNumber))
-        return label
 
 
     def getAALLabel(self, plotNumber=None):
         if plotNumber is None:
             plotNumber = self.plotsSpinBox.value
+        return self.getLabelFromTable(const.AAL, plotNumber)
+
+
+    def updateLabels(self):
         epilocWidget = slicer.modules.EpilocVisualizationWidget
-        label = epilocWidget.atlasReader.getAAL_Label(self.getPlotCenter(plotNumber))
-        return label
+        self.talairachLabel.setText(self.getTalairachLabel())
+        if epilocWidget.mniScene:
+            self.aalLabel.setText(self.getAALLabel())
 
 
     def getAnatomicalLabels(self):
@@ -444,12 +574,29 @@ class Electrode:
 
 
     def onPlotsSlicesSpinBox(self):
+        plotCenter = self.getPlotCenter(self.plotsSpinBox.value)
+        if np.isfinite(plotCenter).all() and self.getDirection() is not None:
+            self.depthSlider.blockSignals(True)
+            self.depthSlider.value = np.linalg.norm(plotCenter - self.getTargetPoint())
+            self.depthSlider.blockSignals(False)
+        epilocWidget = slicer.modules.EpilocVisualizationWidget
+        epilocWidget.scheduleElectrodeUpdate(self)
+
+
+    def onDepthSlider(self):
+        epilocWidget = slicer.modules.EpilocVisualizationWidget
+        epilocWidget.scheduleElectrodeUpdate(self)
+
+
+    def updateViews(self):
+        if not len(self.getValidCenters()):
+            return  # no plot could be placed in the space of the scene
         epilocWidget = slicer.modules.EpilocVisualizationWidget
         reformatMode = epilocWidget.reformatModeCheckBox.isChecked()
         epilocWidget.activeElectrode = self
 
         import EpilocVisualization
-        logic = EpilocVisualization.EpilocVisualizationLogic()
+        logic = EpilocVisualization.getLogic()
 
         self.showOnlyThis()
         self.showOnlyThisPlotsGroupBox()
@@ -459,14 +606,12 @@ class Electrode:
             logic.setLinkedControl(False)
             # logic.sliceIn3DViewVisibility(True, ['Red'])
         else:
+            logic.showProbeEyeSlice(None, bgVolumeNode=epilocWidget.bgSelector.currentNode())
             self.jumpSlices()
             logic.setLinkedControl(True)
             # logic.sliceIn3DViewVisibility(False)
 
         self.center3DView()
 
-        self.talairachLabel.setText(self.getTalairachLabel())
-
-        if epilocWidget.mniScene:
-            self.aalLabel.setText(self.getAALLabel())
+        self.updateLabels()
 
@@ -1,4 +1,7 @@
+import os
 import csv
+import tempfile
+import contextlib
 import xml.etree.ElementTree as ET
 
 import numpy as np
@@ -6,8 +9,66 @@ import numpy as np
 from Electrode import Electrode
 from EpilepsyPlot import EpilepsyPlot
 
+STORE_VERSION = 1
+STORE_EXTENSION = '.npz'
+NUM_TALAIRACH_LABELS = 5
+MNI_COLUMNS = slice(3, 6)
+TALAIRACH_COLUMNS = slice(27, 27 + NUM_TALAIRACH_LABELS)
+NO_LABEL_CODE = -1
+
+
+def iterLocalizationsBatches(csvPaths, batchSize=4096, labelsCodes=None):
+    """
+    Streams the plots of one or more anatomical localizations CSV files as batches of arrays.
+    Only the electrode name, the plot number, the MNI coordinates and the Talairach labels
+    are kept, so memory use depends on the batch size and not on the size of the files.
+
+    :param csvPaths: path or list of paths, read one after the other as a single stream
+    :param batchSize: maximum number of plots per batch
+    :param labelsCodes: dictionary mapping each Talairach label to an integer code.
+    New labels are added to it as they are found, so it can be shared by several streams.
+    :returns: generator of dictionaries with the keys 'files' (index of the CSV file of each plot),
+    'names', 'plotNumbers', 'mni' (N x 3 float32) and 'labels' (N x 5 int32 codes, -1 if missing)
+    """
+    if isinstance(csvPaths, basestring):
+        csvPaths = [csvPaths]
+    if labelsCodes is None:
+        labelsCodes = {}
+    maxSplit = TALAIRACH_COLUMNS.stop
+
+    def makeBatch(files, names, plotNumbers, mni, labels):
+        return {'files': np.array(files, np.int32),
+                'names': np.array(names),
+                'plotNumbers': np.array(plotNumbers, np.int32),
+                'mni': np.array(mni, np.float64).astype(np.float32).reshape(-1, 3),
+                'labels': np.array(labels, np.int32).reshape(-1, NUM_TALAIRACH_LABELS)}
+
+    batch = [], [], [], [], []
+    for fileIndex, csvPath in enumerate(csvPaths):
+        name = None
+        with open(csvPath) as f:
+            for line in f:
+                row = line.rstrip('\r\n').split(';', maxSplit)
+                if len(row) == 1:
+                    if row[0].strip() and row[0] != 'Procedure':
+                        name = row[0]
+                elif row[1].strip() and row[1] != 'Plot number':
+                    labels = row[TALAIRACH_COLUMNS]
+                    codes = [labelsCodes.setdefault(label, len(labelsCodes)) for label in labels]
+                    codes += [NO_LABEL_CODE] * (NUM_TALAIRACH_LABELS - len(codes))
+                    for values, value in zip(batch, (fileIndex, name, int(row[1]), row[MNI_COLUMNS], codes)):
+                        values.append(value)
+                    if len(batch[0]) == batchSize:
+                        yield makeBatch(*batch)
+                        batch = [], [], [], [], []
+    if batch[0]:
+        yield makeBatch(*batch)
+
 class ElectrodesReader:
 
+    # Talairach labels indices keyed by CSV path, shared by all the readers
+    talairachIndices = {}
+
     def getElectrodesFromXML(self, xmlPath):
         electrodes = []
         tree = ET.parse(xmlPath)
@@ -18,7 +79,7 @@ class ElectrodesReader:
             plotsNode = electrodeNode.find('Plots')
             plots = []
             for plotNode in plotsNode:
-                plotNumber = plotNode.get('number')
+                plotNumber = int(plotNode.get('number'))
                 center = np.array([float(plotNode.get(coord)) for coord in ['x', 'y', 'z']])
                 plots.append(EpilepsyPlot(center=center, number=plotNumber))
             electrodes.append(Electrode(name, colorString=color, plots=plots))
@@ -26,36 +87,171 @@ class ElectrodesReader:
 
 
     def getElectrodesFromLocalizationsCSV(self, csvPath):
-        electrodes = []
+        namesAndPlots = []
         with open(csvPath) as f:
-            lines = f.readlines()
-            for line in lines:
+            for line in f:
                 row = line.split(';')
                 if len(row) == 1:
                     if row[0].strip() and row[0] != 'Procedure':
                         name = row[0].rstrip('\r\n')
                         plots = []
-                        electrode = Electrode(name, plots=plots)
-                        electrodes.append(electrode)
+                        namesAndPlots.append((name, plots))
                 else:
                     if row[1].strip() and row[1] != 'Plot number':
                         plotNumber = int(row[1])
                         plot = EpilepsyPlot(number=plotNumber)
                         talairachLabels = [label.rstrip('\r\n') for label in row[27:32]]
                         plot.talairachLabels = talairachLabels
-                        electrode.plots.append(plot)
+                        plots.append(plot)
                         mniCenter = np.array([float(n) for n in row[3:6]])
                         plot.mniCenter = mniCenter
+        electrodes = [Electrode(name, plots=plots) for name, plots in namesAndPlots]
+        return electrodes
+
+
+    def getElectrodes(self, path, useStore=True):
+        """
+        Reads the electrodes from an XML electrodes file or a CSV anatomical localizations file.
+        The parsed electrodes are kept in a binary store next to the source file, which is
+        read instead of the source file while the modification time of the latter does not change.
+
+        :param path: path to the XML or CSV file
+        :param useStore: read and write the binary store
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ('.xml', '.csv'):
+            raise ValueError('Unsupported electrodes file extension "%s": %s' % (extension, path))
+        if useStore:
+            electrodes = self.readStore(path)
+            if electrodes is not None:
+                return electrodes
+        if extension == '.xml':
+            electrodes = self.getElectrodesFromXML(path)
+        else:
+            electrodes = self.getElectrodesFromLocalizationsCSV(path)
+        if useStore:
+            self.writeStore(path, electrodes)
         return electrodes
 
 
+    def getStorePath(self, sourcePath):
+
+        return sourcePath + STORE_EXTENSION
+
+
+    def getStoreKey(self, sourcePath):
+        stat = os.stat(sourcePath)
+        return np.array((STORE_VERSION, stat.st_mtime, stat.st_size), np.float64)
+
+
+    def readStore(self, sourcePath):
+        """
+        :returns: list of Electrode, or None if there is no store up to date for the source file
+        """
+        try:
+            with contextlib.closing(np.load(self.getStorePath(sourcePath))) as store:
+                if not np.array_equal(store['key'], self.getStoreKey(sourcePath)):
+                    return None
+                arrays = dict((key, store[key]) for key in store.files)
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        names = arrays['names'].tolist()
+        colors = arrays['colors'].tolist()
+        plotNumbers = arrays['plotNumbers'].tolist()
+        centers = arrays['centers']
+        mniCenters = arrays['mniCenters']
+        talairachCounts = arrays['talairachCounts']
+        talairachLabels = arrays['talairachLabels'].tolist()
+        offsets = np.concatenate(([0], np.cumsum(arrays['counts']))).astype(int)
+
+        electrodes = []
+        for i, name in enumerate(names):
+            plots = []
+            for j in range(offsets[i], offsets[i+1]):
+                center = None if np.isnan(centers[j, 0]) else centers[j]
+                plot = EpilepsyPlot(center=center, number=plotNumbers[j])
+                if not np.isnan(mniCenters[j, 0]):
+                    plot.mniCenter = mniCenters[j]
+                if talairachCounts[j] >= 0:
+                    plot.talairachLabels = talairachLabels[j][:talairachCounts[j]]
+                plots.append(plot)
+            electrodes.append(Electrode(name, colorString=colors[i] or None, plots=plots))
+        return electrodes
+
+
+    def writeStore(self, sourcePath, electrodes):
+        """
+        Writes the electrodes as typed arrays in an uncompressed .npz file
+        """
+        plots = [plot for electrode in electrodes for plot in electrode.plots]
+        centers = np.full((len(plots), 3), np.nan)
+        mniCenters = np.full((len(plots), 3), np.nan)
+        talairachCounts = np.full(len(plots), -1, int)
+        talairachLabels = [NUM_TALAIRACH_LABELS * ['']] * len(plots)
+        for j, plot in enumerate(plots):
+            if plot.center is not None:
+                centers[j] = plot.center
+            if plot.mniCenter is not None:
+                mniCenters[j] = plot.mniCenter
+            if plot.talairachLabels is not None:
+                labels = list(plot.talairachLabels)[:NUM_TALAIRACH_LABELS]
+                talairachCounts[j] = len(labels)
+                talairachLabels[j] = labels + (NUM_TALAIRACH_LABELS - len(labels)) * ['']
+        arrays = {'key': self.getStoreKey(sourcePath),
+                  'names': np.array([electrode.name for electrode in electrodes]),
+                  'colors': np.array([electrode.colorString or '' for electrode in electrodes]),
+                  'counts': np.array([len(electrode.plots) for electrode in electrodes], int),
+                  'plotNumbers': np.array([int(plot.number) for plot in plots], int),
+                  'centers': centers,
+                  'mniCenters': mniCenters,
+                  'talairachCounts': talairachCounts,
+                  'talairachLabels': np.array(talairachLabels).reshape(len(plots), NUM_TALAIRACH_LABELS)}
+        storePath = self.getStorePath(sourcePath)
+        tempPath = None
+        try:
+            # a unique temporary file, as several threads may write the same store
+            fileDescriptor, tempPath = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(storePath) + '.',
+                                                        dir=os.path.dirname(os.path.abspath(storePath)))
+            with os.fdopen(fileDescriptor, 'wb') as f:
+                np.savez(f, **arrays)
+            if os.path.exists(storePath):  # os.rename does not overwrite on Windows
+                os.remove(storePath)
+            os.rename(tempPath, storePath)
+        except (IOError, OSError):
+            # the store is only an optimization, e.g. the patient folder may be read-only
+            if tempPath is not None and os.path.exists(tempPath):
+                try:
+                    os.remove(tempPath)
+                except OSError:
+                    pass
+
+
+    def getTalairachIndex(self, csvPath):
+        """
+        Returns a dictionary mapping (electrode name, plot number) to the Talairach labels
+        found in the localizations CSV. The index is built once and only rebuilt if the
+        modification time of the file changes.
+
+        :param csvPath: path to the anatomical localizations CSV
+        :returns: dictionary of Talairach labels lists
+        """
+        mtime = os.path.getmtime(csvPath)
+        cached = self.talairachIndices.get(csvPath)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        index = {}
+        for electrode in self.getElectrodes(csvPath):
+            for plot in electrode.plots:
+                index[electrode.name, plot.number] = plot.talairachLabels
+        self.talairachIndices[csvPath] = mtime, index
+        return index
+
+
     def getTalairachLabelFromCSV(self, name, plotNumber, csvPath):
-        electrodes = self.getElectrodesFromLocalizationsCSV(csvPath)
-        for electrode in electrodes:
-            if electrode.name == name:
-                for plot in electrode.plots:
-                    if plot.number == plotNumber:
-                        return plot.talairachLabels
+        index = self.getTalairachIndex(csvPath)
+        return index.get((name, int(plotNumber)))
 
 
 if __name__ == '__main__':
@@ -1,31 +1,46 @@
 import numpy as np
 
-class EpilepsyPlot:
+class EpilepsyPlot(object):
+    """
+    Lightweight view over one row of the centers array of an Electrode.
+    The plot keeps its own center only until it is added to an electrode.
+    """
 
-    def __init__(self, procedure=None, center=None, direction=None, volume=None, label=None, distanceToTrajectory=None, number=None, normalizedCenter=None, anatomicalLabel=None):
-        # python center et dans les coordonnees NiftiWordl du Volume? normalement le CT
-        self.procedure = procedure
+    __slots__ = ('number', 'electrode', 'index', '_center', 'talairachLabels', 'mniCenter')
+
+    def __init__(self, center=None, number=None):
         self.number = number
-        self.center = center
-        self.direction = direction
-        self.volume = volume
-        self.label = label
-        self.distanceToTrajectory = distanceToTrajectory
-        self.description = None
-        self.refPCManualIdentification = None
-        self.refACManualIdentification = None
-        self.refACCenter = None
-        self.diffCenterAutoMan = None
-        self.distanceToTarget = None
-        self.distanceToCalculatedTrajectory = None
-        self.normalizedCenter = normalizedCenter
-        self.anatomicalLabel = anatomicalLabel
-        # ajouts provisoires : todo liste des coordonnees du centre dans differents referentiels
-        self.centerOnT1MriNiftiWorld = None
-        self.centerOnT1MriNiftiIJK = None
-        self.centerOnT1MriPostNiftiWorld = None
-        self.centerOnT1MriPostNiftiIJK = None
-        self.centerOnCTPostNiftiIJK = None
+        self.electrode = None
+        self.index = None
+        self._center = center
+        self.talairachLabels = None
+        self.mniCenter = None
+
+
+    def __repr__(self):
+        return 'Epilepsy plot %s' % self.number
+
+
+    def bind(self, electrode, index):
+        self.electrode = electrode
+        self.index = index
+        self._center = None
+
+
+    @property
+    def center(self):
+        if self.electrode is None:
+            return self._center
+        return self.electrode.centers[self.index]
+
+
+    @center.setter
+    def center(self, center):
+        if self.electrode is None:
+            self._center = center
+        else:
+            self.electrode.centers[self.index] = center
+            self.electrode.invalidateGeometry()
 
 
     def transformCenter(self, matrix):
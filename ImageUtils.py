@@ -0,0 +1,161 @@
+import struct
+import numpy as np
+
+try:
+    import SimpleITK as sitk
+except ImportError:
+    sitk = None
+    import nibabel as nib
+
+LPS_TO_RAS = np.diag((-1, -1, 1, 1))
+NIFTI_HEADER_SIZE = 348
+NIFTI_DTYPES = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64,
+                256: np.int8, 512: np.uint16, 768: np.uint32}
+
+
+def getArrayAndAffineFromITKImage(image):
+    """
+    Returns the voxels of a SimpleITK image indexed as (i, j, k[, component])
+    and the 4x4 matrix mapping voxel indices to RAS world coordinates
+
+    :param image: SimpleITK image
+    """
+    array = sitk.GetArrayFromImage(image)
+    dimension = image.GetDimension()
+    axes = list(range(dimension))[::-1] + list(range(dimension, array.ndim))
+    array = array.transpose(axes)
+
+    direction = np.array(image.GetDirection()).reshape(dimension, dimension)[:3, :3]
+    spacing = np.array(image.GetSpacing())[:3]
+    affine = np.identity(4)
+    affine[:3, :3] = direction * spacing
+    affine[:3, 3] = image.GetOrigin()[:3]
+    affine = np.dot(LPS_TO_RAS, affine)
+    return array, affine
+
+
+def readImageArray(imagePath):
+    """
+    Reads an image as a numpy array indexed as (i, j, k[, component])
+    and the 4x4 matrix mapping voxel indices to RAS world coordinates
+
+    :param imagePath: path to the image
+    :returns: tuple (array, affine)
+    """
+    if sitk is not None:
+        return getArrayAndAffineFromITKImage(sitk.ReadImage(imagePath))
+    else:
+        nii = nib.load(imagePath)
+        return np.asanyarray(nii.dataobj), nii.affine
+
+
+def applyAffine(points, affine):
+    """
+    Applies a 4x4 affine matrix to an (N, 3) array of points
+    """
+    points = np.asarray(points, np.float64)
+    return np.dot(points, affine[:3, :3].T) + affine[:3, 3]
+
+
+def getNearestVoxels(worldCoordinates, worldToVoxelMatrix, shape):
+    """
+    Returns the nearest voxel of each point and a mask of the points lying inside the image
+
+    :param worldCoordinates: (N, 3) array of RAS points
+    :param worldToVoxelMatrix: inverse of the image affine
+    :param shape: shape of the image
+    :returns: tuple ((N, 3) integer array, N-element boolean array). Points with NaN coordinates are outside.
+    """
+    voxels = np.round(applyAffine(worldCoordinates, worldToVoxelMatrix))
+    finite = np.isfinite(voxels).all(axis=1)
+    voxels[~finite] = -1
+    voxels = voxels.astype(int)
+    inside = finite & np.all((voxels >= 0) & (voxels < np.array(shape[:3])), axis=1)
+    return voxels, inside
+
+
+def readNiftiHeader(niftiPath):
+    """
+    Parses the fields of a NIfTI-1 header needed to read its voxels
+
+    :param niftiPath: path to an uncompressed single-file NIfTI-1 image
+    :returns: dictionary with the keys 'shape', 'dtype', 'offset', 'slope', 'intercept' and 'affine'
+    """
+    with open(niftiPath, 'rb') as f:
+        header = f.read(NIFTI_HEADER_SIZE)
+    for endianness in '<', '>':
+        if struct.unpack(endianness + 'i', header[:4])[0] == NIFTI_HEADER_SIZE:
+            break
+    else:
+        raise ValueError('%s is not a NIfTI-1 image' % niftiPath)
+
+    def unpack(fmt, offset):
+        return struct.unpack_from(endianness + fmt, header, offset)
+
+    dim = unpack('8h', 40)
+    datatype = unpack('h', 70)[0]
+    pixdim = unpack('8f', 76)
+    voxOffset, slope, intercept = unpack('3f', 108)
+    qformCode, sformCode = unpack('2h', 252)
+    if datatype not in NIFTI_DTYPES:
+        raise ValueError('NIfTI datatype %d is not supported' % datatype)
+
+    affine = np.identity(4)
+    if sformCode > 0:
+        affine[:3] = np.array(unpack('12f', 280)).reshape(3, 4)
+    elif qformCode > 0:
+        b, c, d = unpack('3f', 256)
+        a = np.sqrt(max(0, 1 - (b*b + c*c + d*d)))
+        rotation = np.array([[a*a + b*b - c*c - d*d, 2 * (b*c - a*d), 2 * (b*d + a*c)],
+                             [2 * (b*c + a*d), a*a + c*c - b*b - d*d, 2 * (c*d - a*b)],
+                             [2 * (b*d - a*c), 2 * (c*d + a*b), a*a + d*d - b*b - c*c]])
+        qfac = -1 if pixdim[0] < 0 else 1
+        affine[:3, :3] = rotation * np.array((pixdim[1], pixdim[2], qfac * pixdim[3]))
+        affine[:3, 3] = unpack('3f', 268)
+    else:
+        affine[:3, :3] = np.diag(pixdim[1:4])
+
+    return {'shape': tuple(dim[1:dim[0]+1]),
+            'dtype': np.dtype(NIFTI_DTYPES[datatype]).newbyteorder(endianness),
+            'offset': max(int(voxOffset), NIFTI_HEADER_SIZE + 4),
+            'slope': slope,
+            'intercept': intercept,
+            'affine': affine}
+
+
+def memmapNifti(niftiPath):
+    """
+    Memory-maps the voxels of an uncompressed NIfTI-1 image, so that only the pages
+    of the file that are accessed are read
+
+    :returns: tuple (array indexed as (i, j, k, ...), affine, (slope, intercept))
+    """
+    header = readNiftiHeader(niftiPath)
+    array = np.memmap(niftiPath, dtype=header['dtype'], mode='r',
+                      offset=header['offset'], shape=header['shape'], order='F')
+    return array, header['affine'], (header['slope'], header['intercept'])
+
+
+def interpolateTrilinear(array, voxels, fillValue=np.nan):
+    """
+    Interpolates an image at many continuous voxel positions at once.
+    Only the voxels surrounding the positions are read, so the image can be memory-mapped.
+
+    :param array: array indexed as (i, j, k[, component])
+    :param voxels: (N, 3) array of voxel coordinates
+    :param fillValue: value assigned to the positions outside the image
+    :returns: array of shape (N[, component])
+    """
+    voxels = np.asarray(voxels, np.float64)
+    shape = np.array(array.shape[:3])
+    inside = np.all((voxels >= 0) & (voxels <= shape - 1), axis=1)
+    base = np.clip(np.floor(voxels).astype(int), 0, np.maximum(shape - 2, 0))
+    fraction = voxels - base
+    weightShape = (-1,) + (1,) * (array.ndim - 3)
+    result = np.zeros((len(voxels),) + array.shape[3:])
+    for corner in np.ndindex(2, 2, 2):
+        indices = np.minimum(base + corner, shape - 1)
+        weights = np.prod(np.where(corner, fraction, 1 - fraction), axis=1)
+        result += weights.reshape(weightShape) * array[indices[:, 0], indices[:, 1], indices[:, 2]]
+    result[~inside] = fillValue
+    return result
@@ -0,0 +1,371 @@
+import numpy as np
+
+NEUTRAL_COLOR = 1, 1, 1
+PROFILE_STEP = 0.5  # mm
+
+def composeAffines(affines):
+    """
+    Composes a chain of affine matrices into a single one
+
+    :param affines: sequence of 4x4 matrices, in the order they must be applied
+    :returns: 4x4 matrix equivalent to applying all the input matrices
+    """
+    composed = np.identity(4)
+    for affine in affines:
+        composed = np.dot(affine, composed)
+    return composed
+
+
+def transformPoints(points, affine):
+    """
+    Applies an affine matrix to an array of points in one batched operation.
+    A stack of K matrices can be applied to a (K, N, 3) array, one matrix per group of points.
+
+    :param points: array of shape (..., 3)
+    :param affine: 4x4 matrix, or (K, 4, 4) stack of matrices
+    :returns: array of transformed points with the same shape as the input
+    """
+    points = np.asarray(points, np.float64)
+    affine = np.asarray(affine, np.float64)
+    rot = affine[..., :3, :3]
+    trans = affine[..., :3, 3]
+    if affine.ndim == 2:
+        return np.dot(points, rot.T) + trans
+    else:
+        return np.einsum('kij,knj->kni', rot, points) + trans[:, np.newaxis, :]
+
+
+def transformImplants(implants, affines):
+    """
+    Applies a different affine matrix to each implant in one batched operation.
+    This is useful to move the electrodes of a whole cohort to a common space.
+
+    :param implants: list of Implant
+    :param affines: sequence of 4x4 matrices, one per implant
+    """
+    affines = np.asarray(affines, np.float64)
+    sizes = [len(implant.centers) for implant in implants]
+    owners = np.repeat(np.arange(len(implants)), sizes)
+    points = np.concatenate([implant.centers for implant in implants])
+    rot = affines[owners, :3, :3]
+    trans = affines[owners, :3, 3]
+    transformed = np.einsum('nij,nj->ni', rot, points) + trans
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    for i, implant in enumerate(implants):
+        implant.centers[:] = transformed[offsets[i]:offsets[i+1]]
+        implant.invalidateGeometry()
+
+def getIntensityProfiles(implants, array, affine, step=PROFILE_STEP, toVolumeAffines=None):
+    """
+    Samples a volume along the trajectories of all the electrodes of several implants
+    in one trilinear interpolation pass, e.g. a cohort normalized to the same template.
+    Each profile starts at the target point and goes beyond the entry point by the length of the screw.
+
+    :param implants: list of Implant
+    :param array: volume indexed as (i, j, k)
+    :param affine: 4x4 matrix mapping voxel indices to RAS
+    :param step: distance between samples in mm
+    :param toVolumeAffines: sequence of 4x4 matrices from the space of each implant to the space of the volume
+    :returns: list with one dictionary per implant mapping the name of each electrode to its profile.
+    Samples outside the volume are NaN. Electrodes with less than two plots have no profile.
+    """
+    if not len(implants):
+        return []
+    import ImageUtils
+    samples = [implant.getTrajectorySamples(step) for implant in implants]
+    points = [implantPoints for implantPoints, sizes in samples]
+    if toVolumeAffines is not None:
+        points = [transformPoints(implantPoints, toVolumeAffine)
+                  for implantPoints, toVolumeAffine in zip(points, toVolumeAffines)]
+    voxels = ImageUtils.applyAffine(np.concatenate(points), np.linalg.inv(affine))
+    values = ImageUtils.interpolateTrilinear(array, voxels)
+
+    allProfiles = []
+    start = 0
+    for implant, (implantPoints, sizes) in zip(implants, samples):
+        profiles = {}
+        for electrode, size in zip(implant.electrodes, sizes):
+            if size:
+                profiles[electrode.name] = values[start:start+size]
+                start += size
+        allProfiles.append(profiles)
+    return allProfiles
+
+
+
+class Implant:
+    """
+    Collection of the electrodes of a patient. The centers of all the plots are stored
+    in one contiguous array and the centers of each electrode are a view over a range of it.
+    """
+
+    def __init__(self, electrodes):
+        self.electrodes = electrodes
+        sizes = [len(electrode.centers) for electrode in electrodes]
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(int)
+        self.centers = np.empty((self.offsets[-1], 3), np.float64)
+        for i, electrode in enumerate(electrodes):
+            start, stop = self.offsets[i], self.offsets[i+1]
+            self.centers[start:stop] = electrode.centers
+            electrode.centers = self.centers[start:stop]
+            electrode.invalidateGeometry()
+
+
+    def __repr__(self):
+        return 'Epilepsy implant (%d electrodes, %d plots)' % (len(self.electrodes), len(self.centers))
+
+
+    def __iter__(self):
+        return iter(self.electrodes)
+
+
+    def __len__(self):
+        return len(self.electrodes)
+
+
+    def getElectrodeRange(self, electrode):
+        i = self.electrodes.index(electrode)
+        return self.offsets[i], self.offsets[i+1]
+
+
+    def transform(self, *affines):
+        """
+        Applies one affine matrix, or a chain of them, to the centers of all the plots
+
+        :param affines: 4x4 matrices, in the order they must be applied
+        """
+        affine = composeAffines(affines)
+        self.centers[:] = transformPoints(self.centers, affine)
+        self.invalidateGeometry()
+
+
+    def getPlotsIndex(self):
+        """
+        Returns a dictionary mapping (electrode name, plot number) to the row of the plot in the centers array
+        """
+        index = {}
+        for i, electrode in enumerate(self.electrodes):
+            for row, number in enumerate(electrode.plotNumbers, self.offsets[i]):
+                index[electrode.name, int(number)] = row
+        return index
+
+
+    def joinMNICenters(self, mniElectrodes):
+        """
+        Replaces the centers of the plots with the MNI centers of the plots with the same
+        electrode name and plot number, in one scatter into the centers array.
+        The centers of the plots without MNI center are invalidated, so that native
+        and MNI coordinates are never mixed.
+
+        :param mniElectrodes: electrodes read from the anatomical localizations CSV
+        :returns: dictionary listing the electrodes and plots that could not be matched
+        """
+        plotsIndex = self.getPlotsIndex()
+        rows = []
+        mniCenters = []
+        unknownPlots = []
+        for mniElectrode in mniElectrodes:
+            for plot in mniElectrode.plots:
+                key = mniElectrode.name, int(plot.number)
+                if key in plotsIndex and plot.mniCenter is not None:
+                    rows.append(plotsIndex.pop(key))
+                    mniCenters.append(plot.mniCenter)
+                else:
+                    unknownPlots.append(key)
+        if rows:
+            self.centers[rows] = mniCenters
+        self.invalidatePlots(sorted(plotsIndex.values()))
+
+        mniNames = set(mniElectrode.name for mniElectrode in mniElectrodes)
+        names = set(electrode.name for electrode in self.electrodes)
+        report = {'electrodesWithoutMNI': sorted(names - mniNames),
+                  'plotsWithoutMNI': sorted(plotsIndex),
+                  'unknownElectrodes': sorted(mniNames - names),
+                  'unknownPlots': sorted(unknownPlots)}
+        return report
+
+
+    def getTrajectorySamples(self, step=PROFILE_STEP):
+        """
+        Returns points every step mm along each electrode, from its target point to
+        beyond its entry point by the length of the screw, stacked in one array
+
+        :returns: tuple ((N, 3) array of points, number of points of each electrode)
+        """
+        directions = np.zeros((len(self.electrodes), 3))
+        sizes = np.zeros(len(self.electrodes), int)
+        for i, electrode in enumerate(self.electrodes):
+            direction = electrode.getDirection()
+            if direction is not None:
+                directions[i] = -direction  # from the target point to the entry point
+                sizes[i] = int(np.floor(electrode.getLength(screw=True) / step)) + 1
+        if not sizes.any():
+            return np.zeros((0, 3)), sizes
+        owners = np.repeat(np.arange(len(self.electrodes)), sizes)
+        starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+        distances = (np.arange(sizes.sum()) - starts) * step
+        targetPoints = np.array([electrode.getTargetPoint() if size else np.zeros(3)
+                                 for electrode, size in zip(self.electrodes, sizes)])
+        points = targetPoints[owners] + distances[:, np.newaxis] * directions[owners]
+        return points, sizes
+
+
+    def getIntensityProfiles(self, array, affine, step=PROFILE_STEP, toVolumeAffine=None):
+        """
+        Samples a volume along the trajectory of every electrode, see getIntensityProfiles
+
+        :param toVolumeAffine: 4x4 matrix from the space of the implant to the space of the volume
+        :returns: dictionary mapping the name of each electrode to its profile
+        """
+        toVolumeAffines = None if toVolumeAffine is None else [toVolumeAffine]
+        return getIntensityProfiles([self], array, affine, step, toVolumeAffines)[0]
+
+
+    def invalidatePlots(self, rows):
+        """
+        Marks the centers of some plots as unknown by setting them to NaN. These plots are
+        not drawn and are ignored to compute the trajectories of the electrodes.
+
+        :param rows: indices of the plots in the centers array
+        """
+        self.centers[rows] = np.nan
+        self.invalidateGeometry()
+
+
+    def invalidateGeometry(self):
+        for electrode in self.electrodes:
+            electrode.invalidateGeometry()
+
+
+    def getPlotsPolyData(self, radius):
+        """
+        Returns spheres around all the plots of the implant, built in one glyphing pass.
+        The index of the electrode of each plot is stored as point scalars.
+
+        :param radius: radius of the spheres
+        """
+        import MeshUtils as mu
+        electrodeIndices = np.repeat(np.arange(len(self.electrodes)), np.diff(self.offsets))
+        valid = np.isfinite(self.centers).all(axis=1)
+        return mu.getSpheresPolyData(self.centers[valid], radius, scalars=electrodeIndices[valid])
+
+
+    def getNameLabelPoints(self, distanceToLabel):
+        """
+        Returns the position of the name label of each electrode, beyond its entry point
+
+        :param distanceToLabel: distance between the entry point and the label
+        """
+        points = np.zeros((len(self.electrodes), 3))
+        for i, electrode in enumerate(self.electrodes):
+            if not len(electrode.getValidCenters()):
+                continue
+            points[i] = electrode.getEntryPoint()
+            direction = electrode.getDirection()
+            if direction is not None:
+                points[i] -= distanceToLabel * direction
+        return points
+
+
+    def makeMarkups(self, distanceToLabel):
+        """
+        Creates one markups node for the names of all the electrodes and one for the
+        numbers of all the plots. The visibility of each electrode is set per point.
+        A markups node has a single color, so the labels are drawn in a neutral color
+        and the labels of the selected electrode use its color through the selected-point color.
+        Plots whose center is unknown have no label.
+
+        :param distanceToLabel: distance between the entry point of each electrode and its name
+        """
+        import EpilocVisualization
+        logic = EpilocVisualization.getLogic()
+
+        valid = np.isfinite(self.centers).all(axis=1)
+        electrodesRows = [np.flatnonzero(valid[start:stop]) + start
+                          for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+        namedIndices = [i for i, rows in enumerate(electrodesRows) if len(rows)]
+
+        self.namesMarkupsNode, self.namesMarkupsDisplayNode = logic.getMarkupsFiducialNode(name='Electrodes names',
+                                                                                           color=NEUTRAL_COLOR,
+                                                                                           glyphScale=0,
+                                                                                           textScale=4)
+        names = [self.electrodes[i].name for i in namedIndices]
+        namePoints = self.getNameLabelPoints(distanceToLabel)[namedIndices].reshape(-1, 3)
+        setMarkupsPoints(self.namesMarkupsNode, namePoints, names)
+
+        self.plotsMarkupsNode, self.plotsMarkupsDisplayNode = logic.getMarkupsFiducialNode(name='Electrodes plots',
+                                                                                           color=NEUTRAL_COLOR,
+                                                                                           glyphScale=0,
+                                                                                           textScale=3)
+        rows = np.concatenate(electrodesRows + [[]]).astype(int)
+        plotNumbers = np.concatenate([electrode.plotNumbers for electrode in self.electrodes] + [[]]).astype(int)
+        setMarkupsPoints(self.plotsMarkupsNode, self.centers[rows], ['%d' % number for number in plotNumbers[rows]])
+        self.markupsNodes = [self.namesMarkupsNode, self.plotsMarkupsNode]
+
+        # indices of the points of each electrode in the two nodes
+        self.electrodesMarkups = {}
+        start = 0
+        for i, electrode in enumerate(self.electrodes):
+            stop = start + len(electrodesRows[i])
+            nameIndex = namedIndices.index(i) if len(electrodesRows[i]) else None
+            names = range(0) if nameIndex is None else range(nameIndex, nameIndex + 1)
+            self.electrodesMarkups[electrode] = names, range(start, stop)
+            start = stop
+
+
+    def setElectrodeMarkupsState(self, electrode, visible=None, selected=None):
+        """
+        Sets the visibility and selection of the name and plots labels of one electrode.
+        The labels of a selected electrode are shown with its color.
+
+        :param electrode: Electrode
+        :param visible: boolean, or None to keep the current visibility
+        :param selected: boolean, or None to keep the current selection
+        """
+        if selected:
+            color = electrode.getColorTupleFloat()
+            self.namesMarkupsDisplayNode.SetSelectedColor(color)
+            self.plotsMarkupsDisplayNode.SetSelectedColor(color)
+        names, plots = self.electrodesMarkups[electrode]
+        setMarkupsPointsState(self.namesMarkupsNode, names, visible, selected)
+        setMarkupsPointsState(self.plotsMarkupsNode, plots, visible, selected)
+
+
+
+def setMarkupsPoints(markupsNode, points, labels):
+    """
+    Replaces the points of a markups fiducial node, firing a single modified event
+
+    :param markupsNode: vtkMRMLMarkupsFiducialNode
+    :param points: (N, 3) array
+    :param labels: N strings
+    """
+    wasModified = markupsNode.StartModify()
+    markupsNode.RemoveAllMarkups()
+    if hasattr(markupsNode, 'SetControlPointPositionsWorld'):  # Slicer >= 4.11
+        import vtk
+        from vtk.util import numpy_support
+        vtkPoints = vtk.vtkPoints()
+        vtkPoints.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(points, np.float64), deep=True))
+        markupsNode.SetControlPointPositionsWorld(vtkPoints)
+    else:
+        for point in points:
+            markupsNode.AddFiducialFromArray(point)
+    for n, label in enumerate(labels):
+        markupsNode.SetNthFiducialLabel(n, label)
+        markupsNode.SetNthFiducialSelected(n, False)
+    markupsNode.EndModify(wasModified)
+
+
+def setMarkupsPointsState(markupsNode, indices, visible=None, selected=None):
+    """
+    Sets the visibility and selection flags of some points of a markups fiducial node,
+    firing a single modified event
+    """
+    wasModified = markupsNode.StartModify()
+    for n in indices:
+        if visible is not None:
+            markupsNode.SetNthFiducialVisibility(n, visible)
+        if selected is not None:
+            markupsNode.SetNthFiducialSelected(n, selected)
+    markupsNode.EndModify(wasModified)
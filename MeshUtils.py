@@ -1,4 +1,6 @@
+import numpy as np
 import vtk
+from vtk.util import numpy_support
 
 
 if vtk.VTK_MAJOR_VERSION > 5:
@@ -22,6 +24,42 @@ def getSpherePolyData(center, radius):
     return polyData
 
 
+def getSpheresPolyData(centers, radius, scalars=None):
+    """
+    Creates a sphere around each point in one glyphing pass.
+    The centers array is passed to VTK without copying it.
+
+    :param centers: (N, 3) array of sphere centers
+    :param radius: radius of the spheres
+    :param scalars: optional N-element array of values copied to the points of each sphere, e.g. for coloring
+    :returns: vtkPolyData containing all the spheres
+    """
+    centers = np.ascontiguousarray(centers, np.float64)
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(centers, deep=False))
+    pointsPolyData = vtk.vtkPolyData()
+    pointsPolyData.SetPoints(points)
+    if scalars is not None:
+        scalars = np.ascontiguousarray(scalars)
+        pointsPolyData.GetPointData().SetScalars(numpy_support.numpy_to_vtk(scalars, deep=False))
+
+    sphere = vtk.vtkSphereSource()
+    sphere.SetRadius(radius)
+    sphere.Update()
+
+    glyph = vtk.vtkGlyph3D()
+    getattr(glyph, setInputMethodeName)(pointsPolyData)
+    getattr(glyph, setSourceMethodeName)(sphere.GetOutput())
+    glyph.SetScaleModeToDataScalingOff()
+    if scalars is not None:
+        glyph.SetColorModeToColorByScalar()
+    glyph.Update()
+
+    polyData = vtk.vtkPolyData()
+    polyData.ShallowCopy(glyph.GetOutput())
+    return polyData
+
+
 def mergePolyData(polyDataList):
     """
     Merges a list of vtkPolyData objects in to a single vtkPolyData object
@@ -1,6 +1,14 @@
 import os
 import epiloc_constants as const
 
+try:
+  from os import scandir
+except ImportError:  # Python 2
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
 MASK_ELECTRODES = 'electrodes.nii.gz'
 MESH_ELECTRODES = 'electrodes.vtk'
 LOG = '_log_postOp.txt'
@@ -20,7 +28,396 @@ REGMAT_T1MRIPOST2ACPC = 't1mri_post_2_acpc.xfm'
 REGMAT_T1MRIPOST2T1MRI = 't1mri_post_2_t1mri.xfm'
 REGMAT_T1MRI2T1MRIPOST = 't1mri_2_t1mri_post.xfm'
 
+# ========================================== Directories ====================================================
+# (attribute, parent directory attribute, directory name)
+
+DIRECTORIES = (
+  # directory for the transformed images
+  ('imagesDir', 'dataDir', 'nifti'),
+
+  # log and perf directories
+  ('logDir', 'dataDir', 'log'),
+  ('perfDir', 'dataDir', 'perf'),
+
+  # directory for templates (locally copied in patients folder for portability reasons)
+  ('templateDir', 'dataDir', 'template'),
+
+  # masks
+  ('maskDir', 'dataDir', 'mask'),
+  ('maskMriRefDir', 'maskDir', 'ref_t1mri'),
+  ('maskCtPostRefDir', 'maskDir', 'ref_ctpost'),
+  ('maskCtPreRefDir', 'maskDir', 'ref_ctpre'),
+  ('maskT1MriPreRefDir', 'maskDir', 'ref_t1mripre'),
+  ('maskParkRefDir', 'maskDir', 'ref_park'),
+
+  # masked images
+  ('maskedDir', 'dataDir', 'masked'),
+
+  # meshes
+  ('meshDir', 'dataDir', 'mesh'),
+  ('meshRASDir', 'dataDir', 'mesh'),
+  ('meshLPSDir', 'dataDir', 'mesh_itk'),
+  ('meshMriRefDir', 'meshRASDir', 'ref_t1mri'),
+  ('meshCtPostRefDir', 'meshRASDir', 'ref_ctpost'),
+  ('meshCtPreRefDir', 'meshRASDir', 'ref_ctpre'),
+  ('meshParkRefDir', 'meshRASDir', 'ref_park'),
+  ('meshT1MriPreRefDir', 'meshRASDir', 'ref_t1mripre'),
+  ('meshParkAtlasDir', 'meshMriRefDir', 'park_atlas'),
+  ('meshParkAtlasLinearDir', 'meshMriRefDir', 'park_atlas_linear'),
+  ('meshYebAtlasDir', 'meshMriRefDir', 'yeb_atlas'),
+  ('meshCtPostVoltageDir', 'meshCtPostRefDir', 'voltage'),
+  ('meshElectrodesDir', 'meshCtPostRefDir', 'electrodes'),
+  ('trajectoriesMeshesDir', 'meshCtPostRefDir', 'trajectories'),
+
+  # registration
+  ('regMatDir', 'dataDir', 'reg_mat'),
+  ('regImaDir', 'dataDir', 'reg_ima'),
+
+  # template registration pipeline
+  ('parkPipelineDir', 'dataDir', 'park_pipeline'),
+  ('atlasYEBPipelineDir', 'dataDir', 'atlasyeb_pipeline'),
+
+  # slicer
+  ('slicerSceneDir', 'dataDir', 'slicer_scene'),
+
+  # color table
+  ('colorTableDir', 'dataDir', 'color_table'),
+
+  # mitk
+  ('mitkDir', 'dataDir', 'mitk'),
+
+  # trajectory
+  ('trajectoryDir', 'dataDir', 'trajectory'),
+
+  # trajectories
+  ('trajectoriesDir', 'dataDir', 'trajectories'),
+
+  # probe's eye stacks of the electrodes
+  ('probeEyeDir', 'dataDir', 'probe_eye'),
+
+  # normalization
+  ('normalizationDir', 'dataDir', 'normalization'),
+
+  # labeled electrodes
+  ('labeledDir', 'maskCtPostRefDir', 'labeled'),
+
+  # templates for the normalization
+  ('templatesDir', 'dataDir', 'templates'),
+)
+
+# ========================================== Files ====================================================
+# (attribute, directory attribute, file name), where '{id}' is replaced by the patient ID
+
+FILES = (
+  # log and performance dictionary files
+  ('logInclusionPath', 'logDir', '{id}_log_inclusion.txt'),
+  ('logPreOpPath', 'logDir', '{id}_log_preop.txt'),
+  ('logPostOpPath', 'logDir', '{id}_log_postop.txt'),
+  ('logYebPath', 'logDir', '{id}_log_yeb.txt'),
+  ('perfInclusionPath', 'perfDir', '{id}_perf_inclusion.pkl'),
+  ('perfPreOpPath', 'perfDir', '{id}_perf_preop.pkl'),
+  ('perfPostOpPath', 'perfDir', '{id}_perf_postop.pkl'),
+  ('perfYebPath', 'perfDir', '{id}_perf_yeb.pkl'),
+
+  # log
+  ('logPath', 'logDir', '{id}' + LOG),
+
+  # inclusion MRIs
+  ('t1mriIncPath', 'dataDir', '{id}_' + const.IMA_T1MRI_INC),
+  ('t2mriIncPath', 'dataDir', '{id}_' + const.IMA_T2MRI_INC),
+
+  # pre-op MRIs (with frame)
+  ('t1mriPrePath', 'imagesDir', '{id}_' + const.IMA_T1MRI_PRE),
+  ('t2mriPrePath', 'imagesDir', '{id}_' + const.IMA_T2MRI_PRE),
+
+  # for T2 Coro Interlaced Park Pitie
+  ('t2mri1mmPrePath', 'dataDir', '{id}_' + const.IMA_T2MRI_1MM_PRE),
+  ('t2mriInterlacedPrePath', 'dataDir', '{id}_' + const.IMA_T2MRI_INTERLACED_PRE),
+
+  # MRIs of reference for segmentation: inclusion if they exist, otherwise pre-op
+  ('t2mriPath', 'dataDir', '{id}_' + const.IMA_T2MRI),
+  ('t2mri1mmPath', 'dataDir', '{id}_' + const.IMA_T2MRI_1MM),
+  ('t2mriInterlacedPath', 'dataDir', '{id}_' + const.IMA_T2MRI_INTERLACED),
+
+  # CT pre- and post-op
+  ('ctPrePath', 'dataDir', '{id}_' + const.IMA_CTPRE),
+  ('ctPostPath', 'imagesDir', '{id}_' + const.IMA_CTPOST),
+
+  # MRI post
+  ('t1mriPostPath', 'imagesDir', '{id}_' + IMA_T1MRI_POST),
+
+  # voltage images
+  ('ctPostVoltageLeftPath', 'dataDir', '{id}_' + const.IMA_CTPOST_VOLTAGE_LEFT),
+  ('ctPostVoltageRightPath', 'dataDir', '{id}_' + const.IMA_CTPOST_VOLTAGE_RIGHT),
+
+  # registered images
+  ('regImaT2Mri2T1MriPath', 'regImaDir', '{id}_' + const.REGIMA_T2MRI2T1MRI),
+  ('regImaCtPre2T1MriPath', 'regImaDir', '{id}_' + const.REGIMA_CTPRE2T1MRI),
+  ('regImaCtPost2CtPrePath', 'regImaDir', '{id}_' + const.REGIMA_CTPOST2CTPRE),
+  ('regImaT1MriPost2T1MriPath', 'regImaDir', '{id}_' + REGIMA_T1MRIPOST2T1MRI),
+  ('regImaInterlacedT2Mri2T1MriPath', 'regImaDir', '{id}_' + const.REGIMA_INTERLACEDT2MRI2T1MRI),
+  ('regImaCtPost2T1MriPath', 'regImaDir', '{id}_' + const.REGIMA_CTPOST2T1MRI),
+
+  # registration matrices FSL convention
+  ('regMatFSLT2Mri2T1MriPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_T2MRI2T1MRI),
+  ('regMatFSLCtPre2T1MriPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_CTPRE2T1MRI),
+  ('regMatFSLCtPost2CtPrePath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_CTPOST2CTPRE),
+  ('regMatFSLCtPost2T1MriPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_CTPOST2T1MRI),
+  ('regMatFSLT1MriPost2T1MriPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + REGMAT_T1MRIPOST2T1MRI),
+  ('regMatFSLT1Mri2T1MriPostPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + REGMAT_T1MRI2T1MRIPOST),
+  ('regMatFSLT1Mri2CtPrePath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_T1MRI2CTPRE),
+  ('regMatFSLT1Mri2CtPostPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_T1MRI2CTPOST),
+  ('regMatFSLFrame2CtPreInitPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_FRAME2CTPRE_INIT),
+  ('regMatFSLFrame2CtPrePath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_FRAME2CTPRE),
+  ('regMatFSLInterlacedT2Mri2T1MriPath', 'regMatDir', '{id}_' + const.MAT_FSL + '_' + const.REGMAT_INTERLACEDT2MRI2T1MRI),
+
+  # registration matrices Nifti World To Nifti World
+  # From T1
+  ('regMatW2WT1Mri2CtPrePath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2CTPRE),
+  ('regMatW2WT1Mri2T1MriPostPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + REGMAT_T1MRI2T1MRIPOST),
+  ('regMatW2WT1MriPost2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + REGMAT_T1MRIPOST2T1MRI),
+  ('regMatW2WT1Mri2CtPostPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2CTPOST),
+  ('regMatW2WT1Mri2ParkPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2PARK),
+  ('regMatW2WT1Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2ACPC),
+  ('regMatW2WLHT1Mri2AtlasYEBPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2YEB_LH),
+  ('regMatW2WRHT1Mri2AtlasYEBPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T1MRI2YEB_RH),
+
+  # From T2
+  ('regMatW2WT2Mri2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T2MRI2T1MRI),
+  ('regMatW2WT2Mri2ParkPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T2MRI2PARK),
+  ('regMatW2WT2Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_T2MRI2ACPC),
+  ('regMatW2WInterlacedT2Mri2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_INTERLACEDT2MRI2T1MRI),
+  ('regMatW2WInterlacedT2Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_INTERLACEDT2MRI2ACPC),
+
+  # From CT-PRE
+  ('regMatW2WCtPre2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPRE2T1MRI),
+  ('regMatW2WCtPre2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPRE2ACPC),
+
+  # From CT-POST
+  ('regMatW2WCtPost2ParkPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPOST2PARK),
+  ('regMatW2WCtPost2CtPrePath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPOST2CTPRE),
+  ('regMatW2WCtPost2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPOST2T1MRI),
+  ('regMatW2WCtPost2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_CTPOST2ACPC),
+  ('regMatW2WT1MriPost2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + REGMAT_T1MRIPOST2ACPC),
+
+  # From Frame
+  ('regMatW2WFrame2CtPreInitPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_FRAME2CTPRE_INIT),
+  ('regMatW2WFrame2CtPrePath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_FRAME2CTPRE),
+  ('regMatW2WFrame2ACPCPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_FRAME2ACPC),
+  ('regMatW2WFrame2T1MriPrePath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_FRAME2T1MRIPRE),
+
+  # From Parkinson tempate
+  ('regMatW2WPark2T1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_PARK2T1MRI),
+
+  # From Atlas Yeb
+  ('regMatW2WAtlasYEB2LHT1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_YEB2T1MRI_LH),
+  ('regMatW2WAtlasYEB2RHT1MriPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + '_' + const.REGMAT_YEB2T1MRI_RH),
+
+  # registration matrices Slicer convention
+  ('regMatSlicerT1Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_T1MRI2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerT2Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_T2MRI2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerInterlacedT2Mri2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_INTERLACEDT2MRI2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerCtPre2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_CTPRE2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerCtPost2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_CTPOST2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerFrame2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_FRAME2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerPark2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_PARK2ACPC.replace('.xfm','.tfm')),
+  ('regMatSlicerAtlasYEB2LHT1MriPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_YEB2T1MRI_LH.replace('.xfm','.tfm')),
+  ('regMatSlicerAtlasYEB2RHT1MriPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + const.REGMAT_YEB2T1MRI_RH.replace('.xfm','.tfm')),
+  ('regMatW2WFrame2CtPostPath', 'regMatDir', '{id}_' + const.MAT_WORLD2WORLD + FRAME_TO_CTPOST),
+  ('regMatSlicerT1MriPost2ACPCPath', 'regMatDir', '{id}_' + const.MAT_SLICER + '_' + REGMAT_T1MRIPOST2ACPC.replace('.xfm','.tfm')),
+
+  # masks in T1MRI referential
+  ('maskHeadPath', 'maskMriRefDir', '{id}_' + const.MASK_HEAD),
+  ('maskBrainPath', 'maskMriRefDir', '{id}_' + const.MASK_BRAIN),
+  ('maskWMPath', 'maskMriRefDir', '{id}_' + const.MASK_WM),
+  ('maskGMPath', 'maskMriRefDir', '{id}_' + const.MASK_GM),
+  ('maskCSFPath', 'maskMriRefDir', '{id}_' + const.MASK_CSF),
+  ('maskCortexLeftPath', 'maskMriRefDir', '{id}_' + const.MASK_CORTEX_LEFT),
+  ('maskCortexRightPath', 'maskMriRefDir', '{id}_' + const.MASK_CORTEX_RIGHT),
+  ('maskSkinPath', 'maskMriRefDir', '{id}_' + const.MASK_SKIN),
+  ('maskSkinEdgesPath', 'maskMriRefDir', '{id}_' + const.MASK_SKIN_EDGES),
+  ('maskParkAtlasPath', 'maskMriRefDir', '{id}_' + const.MASK_PARKINSON_ATLAS),
+  ('maskParkAtlasLinearPath', 'maskMriRefDir', '{id}_' + const.MASK_PARKINSON_ATLAS_LINEAR),
+  ('maskElectrodeLeftPath', 'maskMriRefDir', '{id}_' + const.MASK_ELECTRODE_LEFT),
+  ('maskElectrodeRightPath', 'maskMriRefDir', '{id}_' + const.MASK_ELECTRODE_RIGHT),
+
+  # masks in T1Mri-PRE referential
+  ('t1mriPreRefMaskFrameArtifactPath', 'maskT1MriPreRefDir', '{id}_' + const.REF_T1MRIPRE + '_' + const.MASK_FRAME_ARTIFACT),
+
+  # masks in CT-PRE referential
+  ('ctPreRefMaskFrameArtifactLeftPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_ARTIFACT_LEFT),
+  ('ctPreRefMaskFrameArtifactRightPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_ARTIFACT_RIGHT),
+  ('ctPreRefMaskFrameArtifactAnteriorPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_ARTIFACT_ANTERIOR),
+  ('ctPreRefMaskFrameArtifactPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_ARTIFACT),
+  ('ctPreRefMaskFrameArtifactCCPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_ARTIFACT_CC),
+  ('ctPreRefMaskFrameModelPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_FRAME_MODEL),
+  ('ctPreRefMaskSkullPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_SKULL),
+  ('ctPreRefMaskSupportsPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_SUPPORTS),
+  ('ctPreRefMaskBrainPath', 'maskCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MASK_BRAIN),
+
+  # masks in CT-POST referential
+  ('ctPostRefMaskSkullPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_SKULL),
+  ('ctPostRefMaskCortexLeftPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_CORTEX_LEFT),
+  ('ctPostRefMaskCortexRightPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_CORTEX_RIGHT),
+  ('ctPostRefMaskElectrodeLeftPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_ELECTRODE_LEFT),
+  ('ctPostRefMaskElectrodeRightPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_ELECTRODE_RIGHT),
+
+  # CT-POST voltage masks
+  ('ctPostRefMaskVoltageLeftPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_VOLTAGE_LEFT),
+  ('ctPostRefMaskVoltageRightPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_VOLTAGE_RIGHT),
+  ('ctPostRefMaskVoltagePath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_VOLTAGE),
+
+  # meshes for visualization in MITK
+  ('MITKmeshSulciPath', 'mitkDir', '{id}_' + const.MESH_SULCI),
+  ('MITKmeshHeadPath', 'mitkDir', '{id}_' + const.MESH_HEAD),
+  ('MITKmeshInsertionZoneLeftPath', 'mitkDir', '{id}_' + const.MESH_INSERTION_ZONE_LEFT),
+  ('MITKmeshInsertionZoneRightPath', 'mitkDir', '{id}_' + const.MESH_INSERTION_ZONE_RIGHT),
+
+  # meshes in MRI referential
+  ('meshSulciLeftPath', 'meshMriRefDir', '{id}_' + const.MESH_SULCI_LEFT),
+  ('meshSulciRightPath', 'meshMriRefDir', '{id}_' + const.MESH_SULCI_RIGHT),
+  ('meshHeadPath', 'meshMriRefDir', '{id}_' + const.MESH_HEAD),
+  ('meshSkinPath', 'meshMriRefDir', '{id}_' + const.MESH_SKIN),
+  ('meshSkinEdgesPath', 'meshMriRefDir', '{id}_' + const.MESH_SKIN_EDGES),
+  ('meshGrayPialLeftPath', 'meshMriRefDir', '{id}_' + const.MESH_GRAY_PIAL_LEFT),
+  ('meshGrayPialRightPath', 'meshMriRefDir', '{id}_' + const.MESH_GRAY_PIAL_RIGHT),
+  ('meshGrayWhiteLeftPath', 'meshMriRefDir', '{id}_' + const.MESH_GRAY_WHITE_LEFT),
+  ('meshGrayWhiteRightPath', 'meshMriRefDir', '{id}_' + const.MESH_GRAY_WHITE_RIGHT),
+  ('meshACPath', 'meshMriRefDir', '{id}_' + const.MESH_AC),
+  ('meshPCPath', 'meshMriRefDir', '{id}_' + const.MESH_PC),
+  ('meshIHPath', 'meshMriRefDir', '{id}_' + const.MESH_IH),
+  ('meshInsertionZoneLeftPath', 'meshMriRefDir', '{id}_' + const.MESH_INSERTION_ZONE_LEFT),
+  ('meshInsertionZoneRightPath', 'meshMriRefDir', '{id}_' + const.MESH_INSERTION_ZONE_RIGHT),
+
+  # meshes in T1Mri-PRE referential
+  ('t1mriPreRefMeshFrameArtifactPath', 'meshT1MriPreRefDir', '{id}_' + const.REF_T1MRIPRE + '_' + const.MESH_FRAME_ARTIFACT),
+  ('t1mriPreRefMeshFrameModelPath', 'meshT1MriPreRefDir', '{id}_' + const.REF_T1MRIPRE + '_' + const.MESH_FRAME_MODEL),
+
+  # meshes in CT-PRE referential
+  ('ctPreRefMeshFrameArtifactPath', 'meshCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MESH_FRAME_ARTIFACT),
+  ('ctPreRefMeshFramePointsPath', 'meshCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MESH_FRAME_POINTS),
+  ('ctPreRefMeshFrameModelPath', 'meshCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MESH_FRAME_MODEL),
+  ('ctPreRefMeshSkullPath', 'meshCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MESH_SKULL),
+  ('ctPreRefMeshSupportsPath', 'meshCtPreRefDir', '{id}_' + const.REF_CTPRE + '_' + const.MESH_SUPPORTS),
+
+  # meshes in CT POST referential
+  ('ctPostRefMeshElectrodeLeftPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_LEFT),
+  ('ctPostRefMeshElectrodeRightPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_RIGHT),
+  ('ctPostRefMeshElectrodeModelLeftAxisPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_MODEL_AXIS_LEFT),
+  ('ctPostRefMeshElectrodeModelLeftContactsPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_MODEL_CONTACTS_LEFT),
+  ('ctPostRefMeshElectrodeModelRightAxisPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_MODEL_AXIS_RIGHT),
+  ('ctPostRefMeshElectrodeModelRightContactsPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MESH_ELECTRODE_MODEL_CONTACTS_RIGHT),
+  ('ctPostRefMeshElectrodeCurveLeftPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.BAR_MESH_ELECTRODE_LEFT),
+  ('ctPostRefMeshElectrodeCurveRightPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.BAR_MESH_ELECTRODE_RIGHT),
+
+  # meshes in Parkinson Template referential
+  ('parkRefMeshElectrodeLeftPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_LEFT),
+  ('parkRefMeshElectrodeRightPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_RIGHT),
+  ('parkRefMeshElectrodeModelLeftAxisPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_MODEL_AXIS_LEFT),
+  ('parkRefMeshElectrodeModelLeftContactsPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_MODEL_CONTACTS_LEFT),
+  ('parkRefMeshElectrodeModelRightAxisPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_MODEL_AXIS_RIGHT),
+  ('parkRefMeshElectrodeModelRightContactsPath', 'meshParkRefDir', '{id}_' + const.REF_PARK + '_' + const.MESH_ELECTRODE_MODEL_CONTACTS_RIGHT),
+
+  # masked images
+  ('maskedT1mriBrainPath', 'maskedDir', '{id}_' + const.MASKED_T1MRI_BRAIN),
+  ('maskedT1MriHeadPath', 'maskedDir', '{id}_' + const.MASKED_T1MRI_HEAD),
+  ('maskedCtPostCortexLeftPath', 'maskedDir', '{id}_' + const.MASKED_CTPOST_CORTEX_LEFT),
+  ('maskedCtPostCortexRightPath', 'maskedDir', '{id}_' + const.MASKED_CTPOST_CORTEX_RIGHT),
+
+  # MRML scenes
+  ('sceneInclusionPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_INCLUSION),
+  ('MITKsceneInclusionPath', 'mitkDir', '{id}_' + const.MRML_SCENE_INCLUSION),
+  ('scenePreOpPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_PREOP),
+  ('scenePreOpPitiePath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_PREOP_PITIE),
+  ('scenePreOpElectrodeLeftPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_PREOP_ELECTRODE_LEFT),
+  ('scenePreOpElectrodeRightPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_PREOP_ELECTRODE_RIGHT),
+  ('scenePostOpPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_POSTOP),
+  ('scenePostOpElectrodeLeftPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_POSTOP_ELECTRODE_LEFT),
+  ('scenePostOpElectrodeRightPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_POSTOP_ELECTRODE_RIGHT),
+  ('scenePostOpVoltagePath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_POSTOP_VOLTAGE),
+  ('sceneYeBPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_YEB),
+
+  # color tables
+  ('parkinsonColorTablePath', 'colorTableDir', '{id}_' + const.PARK_COLOR_TABLE),
+  ('voltageColorTablePath', 'colorTableDir', '{id}_' + const.VOLTAGE_COLOR_TABLE),
+  ('yebColorTablePath', 'colorTableDir', '{id}_' + const.YEB_COLOR_TABLE),
+
+  # clinical template volume
+  ('clinicalNoCriteriaVolumePath', 'templateDir', 'clinical_atlas.nii.gz'),
+
+  # trajectories
+  ('inclusionTrajectoryManualPath', 'trajectoryDir', '{id}_' + const.INCLUSION_TRAJECTORY_MANUAL),
+  ('inclusionTrajectoryAutomaticPath', 'trajectoryDir', '{id}_' + const.INCLUSION_TRAJECTORY_AUTOMATIC),
+  ('leksellTrajectoryPath', 'trajectoryDir', '{id}_' + const.LEKSELL_TRAJECTORY),
+
+  # Normalization
+  ('inverseDeformationFieldPath', 'normalizationDir', (INVERSE_WARP + '{id}_' + const.MASKED_T1MRI_HEAD).rstrip('.gz')),
+  ('normalizedT1MriPath', 'normalizationDir', (NORMALIZED_T1 + '{id}_' + const.MASKED_T1MRI_HEAD).rstrip('.gz')),
+  ('maskedHeadUnbiasedPath', 'maskedDir', '{id}_' + const.MASKED_T1MRI_HEAD_UNBIASED),
+  ('normalizationFieldPath', 'normalizationDir', '{id}_' + const.NORMALIZATION_FIELD),
+  ('normalizationFieldInvertedPath', 'normalizationDir', '{id}_' + const.NORMALIZATION_FIELD_INVERTED),
+  ('regImaCtPost2MNIPath', 'normalizationDir', ('w{id}_' + const.REGIMA_CTPOST2T1MRI).rstrip('.gz')),
+  ('regImaT1MriPost2MNIPath', 'normalizationDir', ('w{id}_' + REGIMA_T1MRIPOST2T1MRI).rstrip('.gz')),
+  ('regImaT1MriPre2MNIPath', 'normalizationDir', ('w{id}_' + const.IMA_T1MRI_PRE).rstrip('.gz')),
+  ('mniRefMaskHeadPath', 'normalizationDir', 'w{id}_' + const.MASK_HEAD),
+
+  # anatomical localizations
+  ('localizationsPath', 'dataDir', '{id}_' + ANATOMICAL_LOCALIZATIONS),
+
+  # masks in CT-POST referential
+  ('ctPostRefMaskElectrodesPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + MASK_ELECTRODES),
+
+  # meshes
+  ('meshShaftsPath', 'meshElectrodesDir', '{id}_shafts.vtk'),
+  ('meshScrewsPath', 'meshElectrodesDir', '{id}_screws.vtk'),
+
+  # meshes in CT POST referential
+  ('ctPostRefMeshElectrodesPath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + MESH_ELECTRODES),
+  ('meshACFramePath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + MESH_AC + '_frame.vtk'),
+  ('meshPCFramePath', 'meshCtPostRefDir', '{id}_' + const.REF_CTPOST + MESH_PC + '_frame.vtk'),
+
+  # MRML scene
+  ('scenePath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_POSTOP),
+  ('sceneMNIPath', 'slicerSceneDir', '{id}_' + const.MRML_SCENE_MNI),
+
+  # trajectories information
+  ('trajectoriesPath', 'trajectoriesDir', '{id}_' + TRAJECTORIES),
+
+  # electrodes
+  ('electrodesPath', 'dataDir', '{id}_' + ELECTRODES_OBJECT),
+  ('ctPostRefMaskHeadPath', 'maskCtPostRefDir', '{id}_' + const.REF_CTPOST + '_' + const.MASK_HEAD),
+  ('labeledElectrodesPath', 'labeledDir', '{id}_labeledElectrodes.nii.gz'),
+
+  # results
+  ('coordinatesPath', 'dataDir', '{id}_' + ANATOMICAL_LOCALIZATIONS),
+  ('xmlPath', 'dataDir', '{id}_' + ELECTRODES_XML),
+  ('xmlVerifiedPath', 'dataDir', '{id}_' + ELECTRODES_XML.replace('.xml', '_verified.xml')),
+  ('statsPath', 'dataDir', '{id}_' + STATS),
+
+  # templates for the normalization
+  ('templateDartelPath', 'templatesDir', 'avgT1_Dartel_IXI550_MNI152.nii'),
+  ('templatePath', 'templatesDir', 'T1.nii'),
+)
+
+
+# (attribute, file attribute), True if the file exists
+PRESENCE_FLAGS = (
+  # reference MRI for segmentation: inclusion if it exists, otherwise pre-op
+  ('refMriIsInclusion', 't1mriIncPath'),
+  ('t2MriPresent', 't2mriPath'),
+  ('t2Mri1mmPresent', 't2mri1mmPath'),
+)
+
+DIRECTORIES_MAP = dict((name, (parent, dirName)) for name, parent, dirName in DIRECTORIES)
+FILES_MAP = dict((name, (directory, fileName)) for name, directory, fileName in FILES)
+PRESENCE_FLAGS_MAP = dict(PRESENCE_FLAGS)
+
+
 class PatientModelEpilepsy:
+  """
+  Paths to the files of a patient. The paths declared in DIRECTORIES and FILES are
+  only resolved when the corresponding attribute is first accessed, then memoized.
+  """
   def __init__(self,patientId, epilepsyId=None, rootDir=None):
 
     self.patientId = patientId
@@ -30,402 +427,168 @@ class PatientModelEpilepsy:
 
     if rootDir is None:
       self.rootDir = 'patients'
-    # ========================================== Directories ====================================================
 
     # root directory for the patient
     self.dataDir = os.path.join(self.rootDir,self.idString)
 
-    # directory for the transformed images
-    self.imagesDir = os.path.join(self.dataDir, 'nifti')
-
-    # log and perf directories
-    self.logDir = os.path.join(self.dataDir,'log')
-    self.perfDir = os.path.join(self.dataDir,'perf')
-
-    # log and performance dictionary files
-    self.logInclusionPath = os.path.join(self.logDir,self.idString+'_log_inclusion.txt')
-    self.logPreOpPath = os.path.join(self.logDir,self.idString+'_log_preop.txt')
-    self.logPostOpPath = os.path.join(self.logDir,self.idString+'_log_postop.txt')
-    self.logYebPath = os.path.join(self.logDir,self.idString+'_log_yeb.txt')
-    self.perfInclusionPath = os.path.join(self.perfDir,self.idString+'_perf_inclusion.pkl')
-    self.perfPreOpPath = os.path.join(self.perfDir,self.idString+'_perf_preop.pkl')
-    self.perfPostOpPath = os.path.join(self.perfDir,self.idString+'_perf_postop.pkl')
-    self.perfYebPath = os.path.join(self.perfDir,self.idString+'_perf_yeb.pkl')
-
-    # directory for templates (locally copied in patients folder for portability reasons)
-    self.templateDir = os.path.join(self.dataDir,'template')
-
-    # masks
-    self.maskDir = os.path.join(self.dataDir,'mask')
-    self.maskMriRefDir = os.path.join(self.maskDir,'ref_t1mri')
-    self.maskCtPostRefDir = os.path.join(self.maskDir,'ref_ctpost')
-    self.maskCtPreRefDir = os.path.join(self.maskDir,'ref_ctpre')
-    self.maskT1MriPreRefDir = os.path.join(self.maskDir,'ref_t1mripre')
-    self.maskParkRefDir = os.path.join(self.maskDir,'ref_park')
-
-    # masked images
-    self.maskedDir = os.path.join(self.dataDir,'masked')
-
-    # meshes
-    self.meshDir = os.path.join(self.dataDir,'mesh')
-    self.meshRASDir = self.meshDir
-    self.meshLPSDir = os.path.join(self.dataDir,'mesh_itk')
-    self.meshMriRefDir = os.path.join(self.meshRASDir,'ref_t1mri')
-    self.meshCtPostRefDir = os.path.join(self.meshRASDir,'ref_ctpost')
-    self.meshCtPreRefDir = os.path.join(self.meshRASDir,'ref_ctpre')
-    self.meshParkRefDir = os.path.join(self.meshRASDir,'ref_park')
-    self.meshT1MriPreRefDir = os.path.join(self.meshRASDir,'ref_t1mripre')
-    self.meshParkAtlasDir = os.path.join(self.meshMriRefDir,'park_atlas')
-    self.meshParkAtlasLinearDir = os.path.join(self.meshMriRefDir,'park_atlas_linear')
-    self.meshYebAtlasDir = os.path.join(self.meshMriRefDir,'yeb_atlas')
-    self.meshCtPostVoltageDir = os.path.join(self.meshCtPostRefDir,'voltage')
-
-    self.meshElectrodesDir = os.path.join(self.meshCtPostRefDir,'electrodes')
-    self.trajectoriesMeshesDir = os.path.join(self.meshCtPostRefDir,'trajectories')
-
-    # registration
-    self.regMatDir = os.path.join(self.dataDir,'reg_mat')
-    self.regImaDir = os.path.join(self.dataDir,'reg_ima')
-
-    # template registration pipeline
-    self.parkPipelineDir = os.path.join(self.dataDir,'park_pipeline')
-    self.atlasYEBPipelineDir = os.path.join(self.dataDir,'atlasyeb_pipeline')
-
-    # slicer
-    self.slicerSceneDir = os.path.join(self.dataDir,'slicer_scene')
-
-    # color table
-    self.colorTableDir = os.path.join(self.dataDir,'color_table')
-
-    # mitk
-    self.mitkDir = os.path.join(self.dataDir,'mitk')
-
-    # trajectory
-    self.trajectoryDir = os.path.join(self.dataDir,'trajectory')
-
-    # trajectories
-    self.trajectoriesDir = os.path.join(self.dataDir, 'trajectories')
-
-    # normalization
-    self.normalizationDir = os.path.join(self.dataDir,'normalization')
-
-    # ========================================== Files ====================================================
-
-    # log
-    self.logPath = os.path.join(self.logDir, self.idString + LOG)
-
-    # inclusion MRIs
-    self.t1mriIncPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T1MRI_INC)
-    self.t2mriIncPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI_INC)
-
-    # pre-op MRIs (with frame)
-    self.t1mriPrePath = os.path.join(self.imagesDir,self.idString+'_'+const.IMA_T1MRI_PRE)
-    self.t2mriPrePath = os.path.join(self.imagesDir,self.idString+'_'+const.IMA_T2MRI_PRE)
-
-    # for T2 Coro Interlaced Park Pitie
-    self.t2mri1mmPrePath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI_1MM_PRE)
-    self.t2mriInterlacedPrePath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI_INTERLACED_PRE)
-
-    # MRIs of reference for segmentation: inclusion if they exist, otherwise pre-op
-    self.refMriIsInclusion = None
-    self.t2mriPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI)
-    self.t2mri1mmPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI_1MM)
-    self.t2mriInterlacedPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_T2MRI_INTERLACED)
-
-    # CT pre- and post-op
-    self.ctPrePath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_CTPRE)
-    self.ctPostPath = os.path.join(self.imagesDir,self.idString+'_'+const.IMA_CTPOST)
-
-    # MRI post
-    self.t1mriPostPath = os.path.join(self.imagesDir,self.idString+'_'+IMA_T1MRI_POST)
-
-    # voltage images
-    self.ctPostVoltageLeftPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_CTPOST_VOLTAGE_LEFT)
-    self.ctPostVoltageRightPath = os.path.join(self.dataDir,self.idString+'_'+const.IMA_CTPOST_VOLTAGE_RIGHT)
-
-
-    # registered images
-    self.regImaT2Mri2T1MriPath = os.path.join(self.regImaDir,self.idString+'_'+const.REGIMA_T2MRI2T1MRI)
-    self.regImaCtPre2T1MriPath = os.path.join(self.regImaDir,self.idString+'_'+const.REGIMA_CTPRE2T1MRI)
-    self.regImaCtPost2CtPrePath = os.path.join(self.regImaDir,self.idString+'_'+const.REGIMA_CTPOST2CTPRE)
-    self.regImaT1MriPost2T1MriPath = os.path.join(self.regImaDir,self.idString+'_'+REGIMA_T1MRIPOST2T1MRI)
-
-    self.regImaInterlacedT2Mri2T1MriPath = os.path.join(self.regImaDir,self.idString+'_'+const.REGIMA_INTERLACEDT2MRI2T1MRI)
-
-
-    self.regImaCtPost2T1MriPath = os.path.join(self.regImaDir,self.idString+'_'+const.REGIMA_CTPOST2T1MRI)
-
-    # registration matrices FSL convention
-    self.regMatFSLT2Mri2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_T2MRI2T1MRI)
-    self.regMatFSLCtPre2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_CTPRE2T1MRI)
-    self.regMatFSLCtPost2CtPrePath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_CTPOST2CTPRE)
-    self.regMatFSLCtPost2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_CTPOST2T1MRI)
-    self.regMatFSLT1MriPost2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+REGMAT_T1MRIPOST2T1MRI)
-    self.regMatFSLT1Mri2T1MriPostPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+REGMAT_T1MRI2T1MRIPOST)
-
-    self.regMatFSLT1Mri2CtPrePath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_T1MRI2CTPRE)
-    self.regMatFSLT1Mri2CtPostPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_T1MRI2CTPOST)
-    self.regMatFSLFrame2CtPreInitPath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_FRAME2CTPRE_INIT)
-    self.regMatFSLFrame2CtPrePath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_FRAME2CTPRE)
-    self.regMatFSLInterlacedT2Mri2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_FSL+'_'+const.REGMAT_INTERLACEDT2MRI2T1MRI)
-
-
-    # registration matrices Nifti World To Nifti World
-
-    # From T1
-    self.regMatW2WT1Mri2CtPrePath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2CTPRE)
-    self.regMatW2WT1Mri2T1MriPostPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+REGMAT_T1MRI2T1MRIPOST)
-    self.regMatW2WT1MriPost2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+REGMAT_T1MRIPOST2T1MRI)
-
-    self.regMatW2WT1Mri2CtPostPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2CTPOST)
-    self.regMatW2WT1Mri2ParkPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2PARK)
-    self.regMatW2WT1Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2ACPC)
-    self.regMatW2WLHT1Mri2AtlasYEBPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2YEB_LH)
-    self.regMatW2WRHT1Mri2AtlasYEBPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T1MRI2YEB_RH)
-
-    # From T2
-    self.regMatW2WT2Mri2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T2MRI2T1MRI)
-    self.regMatW2WT2Mri2ParkPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T2MRI2PARK)
-    self.regMatW2WT2Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_T2MRI2ACPC)
-    self.regMatW2WInterlacedT2Mri2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_INTERLACEDT2MRI2T1MRI)
-    self.regMatW2WInterlacedT2Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_INTERLACEDT2MRI2ACPC)
-
-    # From CT-PRE
-    self.regMatW2WCtPre2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPRE2T1MRI)
-    self.regMatW2WCtPre2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPRE2ACPC)
-
-    # From CT-POST
-    self.regMatW2WCtPost2ParkPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPOST2PARK)
-    self.regMatW2WCtPost2CtPrePath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPOST2CTPRE)
-    self.regMatW2WCtPost2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPOST2T1MRI)
-    self.regMatW2WCtPost2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_CTPOST2ACPC)
-    self.regMatW2WT1MriPost2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+REGMAT_T1MRIPOST2ACPC)
-
-    # From Frame
-    self.regMatW2WFrame2CtPreInitPath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_FRAME2CTPRE_INIT)
-    self.regMatW2WFrame2CtPrePath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_FRAME2CTPRE)
-    self.regMatW2WFrame2ACPCPath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_FRAME2ACPC)
-    self.regMatW2WFrame2T1MriPrePath =  os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_FRAME2T1MRIPRE)
-
-    # From Parkinson tempate
-    self.regMatW2WPark2T1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_PARK2T1MRI)
-
-    # From Atlas Yeb
-    self.regMatW2WAtlasYEB2LHT1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_YEB2T1MRI_LH)
-    self.regMatW2WAtlasYEB2RHT1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+'_'+const.REGMAT_YEB2T1MRI_RH)
-
-    # registration matrices Slicer convention
-    self.regMatSlicerT1Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_T1MRI2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerT2Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_T2MRI2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerInterlacedT2Mri2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_INTERLACEDT2MRI2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerCtPre2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_CTPRE2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerCtPost2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_CTPOST2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerFrame2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_FRAME2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerPark2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_PARK2ACPC.replace('.xfm','.tfm'))
-    self.regMatSlicerAtlasYEB2LHT1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_YEB2T1MRI_LH.replace('.xfm','.tfm'))
-    self.regMatSlicerAtlasYEB2RHT1MriPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+const.REGMAT_YEB2T1MRI_RH.replace('.xfm','.tfm'))
-    self.regMatW2WFrame2CtPostPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_WORLD2WORLD+FRAME_TO_CTPOST)
-    self.regMatSlicerT1MriPost2ACPCPath = os.path.join(self.regMatDir,self.idString+'_'+const.MAT_SLICER+'_'+REGMAT_T1MRIPOST2ACPC.replace('.xfm','.tfm'))
-
-
-    # masks in T1MRI referential
-    self.maskHeadPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_HEAD)
-    self.maskBrainPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_BRAIN)
-    self.maskWMPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_WM)
-    self.maskGMPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_GM)
-    self.maskCSFPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_CSF)
-    self.maskCortexLeftPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_CORTEX_LEFT)
-    self.maskCortexRightPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_CORTEX_RIGHT)
-    self.maskSkinPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_SKIN)
-    self.maskSkinEdgesPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_SKIN_EDGES)
-    self.maskParkAtlasPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_PARKINSON_ATLAS)
-    self.maskParkAtlasLinearPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_PARKINSON_ATLAS_LINEAR)
-
-    self.maskElectrodeLeftPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_ELECTRODE_LEFT)
-    self.maskElectrodeRightPath = os.path.join(self.maskMriRefDir,self.idString+'_'+const.MASK_ELECTRODE_RIGHT)
-
-
-    # masks in T1Mri-PRE referential
-    self.t1mriPreRefMaskFrameArtifactPath = os.path.join(self.maskT1MriPreRefDir,self.idString+'_'+const.REF_T1MRIPRE+'_'+const.MASK_FRAME_ARTIFACT)
-
-    # masks in CT-PRE referential
-    self.ctPreRefMaskFrameArtifactLeftPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_ARTIFACT_LEFT)
-    self.ctPreRefMaskFrameArtifactRightPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_ARTIFACT_RIGHT)
-    self.ctPreRefMaskFrameArtifactAnteriorPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_ARTIFACT_ANTERIOR)
-    self.ctPreRefMaskFrameArtifactPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_ARTIFACT)
-    self.ctPreRefMaskFrameArtifactCCPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_ARTIFACT_CC)
-    self.ctPreRefMaskFrameModelPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_FRAME_MODEL)
-    self.ctPreRefMaskSkullPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_SKULL)
-    self.ctPreRefMaskSupportsPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_SUPPORTS)
-    self.ctPreRefMaskBrainPath = os.path.join(self.maskCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MASK_BRAIN)
-
-    # masks in CT-POST referential
-    self.ctPostRefMaskSkullPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_SKULL)
-    self.ctPostRefMaskCortexLeftPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_CORTEX_LEFT)
-    self.ctPostRefMaskCortexRightPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_CORTEX_RIGHT)
-    self.ctPostRefMaskElectrodeLeftPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_ELECTRODE_LEFT)
-    self.ctPostRefMaskElectrodeRightPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_ELECTRODE_RIGHT)
-
-    # CT-POST voltage masks
-    self.ctPostRefMaskVoltageLeftPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_VOLTAGE_LEFT)
-    self.ctPostRefMaskVoltageRightPath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_VOLTAGE_RIGHT)
-    self.ctPostRefMaskVoltagePath = os.path.join(self.maskCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_VOLTAGE)
-
-    # meshes for visualization in MITK
-    self.MITKmeshSulciPath = os.path.join(self.mitkDir,self.idString+'_'+const.MESH_SULCI)
-    self.MITKmeshHeadPath = os.path.join(self.mitkDir,self.idString+'_'+const.MESH_HEAD)
-    self.MITKmeshInsertionZoneLeftPath = os.path.join(self.mitkDir,self.idString+'_'+const.MESH_INSERTION_ZONE_LEFT)
-    self.MITKmeshInsertionZoneRightPath = os.path.join(self.mitkDir,self.idString+'_'+const.MESH_INSERTION_ZONE_RIGHT)
-
-    # meshes in MRI referential
-    self.meshSulciLeftPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_SULCI_LEFT)
-    self.meshSulciRightPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_SULCI_RIGHT)
-
-    self.meshHeadPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_HEAD)
-    self.meshSkinPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_SKIN)
-    self.meshSkinEdgesPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_SKIN_EDGES)
-
-    self.meshGrayPialLeftPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_GRAY_PIAL_LEFT)
-    self.meshGrayPialRightPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_GRAY_PIAL_RIGHT)
-
-    self.meshGrayWhiteLeftPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_GRAY_WHITE_LEFT)
-    self.meshGrayWhiteRightPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_GRAY_WHITE_RIGHT)
-
-    self.meshACPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_AC)
-    self.meshPCPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_PC)
-    self.meshIHPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_IH)
-
-    self.meshInsertionZoneLeftPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_INSERTION_ZONE_LEFT)
-    self.meshInsertionZoneRightPath = os.path.join(self.meshMriRefDir,self.idString+'_'+const.MESH_INSERTION_ZONE_RIGHT)
-
-    # meshes in T1Mri-PRE referential
-    self.t1mriPreRefMeshFrameArtifactPath = os.path.join(self.meshT1MriPreRefDir,self.idString+'_'+const.REF_T1MRIPRE+'_'+const.MESH_FRAME_ARTIFACT)
-    self.t1mriPreRefMeshFrameModelPath = os.path.join(self.meshT1MriPreRefDir,self.idString+'_'+const.REF_T1MRIPRE+'_'+const.MESH_FRAME_MODEL)
-
-    # meshes in CT-PRE referential
-    self.ctPreRefMeshFrameArtifactPath = os.path.join(self.meshCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MESH_FRAME_ARTIFACT)
-    self.ctPreRefMeshFramePointsPath = os.path.join(self.meshCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MESH_FRAME_POINTS)
-    self.ctPreRefMeshFrameModelPath = os.path.join(self.meshCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MESH_FRAME_MODEL)
-    self.ctPreRefMeshSkullPath = os.path.join(self.meshCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MESH_SKULL)
-    self.ctPreRefMeshSupportsPath = os.path.join(self.meshCtPreRefDir,self.idString+'_'+const.REF_CTPRE+'_'+const.MESH_SUPPORTS)
-
-    # meshes in CT POST referential
-    self.ctPostRefMeshElectrodeLeftPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_LEFT)
-    self.ctPostRefMeshElectrodeRightPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_RIGHT)
-    self.ctPostRefMeshElectrodeModelLeftAxisPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_MODEL_AXIS_LEFT)
-    self.ctPostRefMeshElectrodeModelLeftContactsPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_MODEL_CONTACTS_LEFT)
-    self.ctPostRefMeshElectrodeModelRightAxisPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_MODEL_AXIS_RIGHT)
-    self.ctPostRefMeshElectrodeModelRightContactsPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.MESH_ELECTRODE_MODEL_CONTACTS_RIGHT)
-    self.ctPostRefMeshElectrodeCurveLeftPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.BAR_MESH_ELECTRODE_LEFT)
-    self.ctPostRefMeshElectrodeCurveRightPath = os.path.join(self.meshCtPostRefDir,self.idString+'_'+const.REF_CTPOST+'_'+const.BAR_MESH_ELECTRODE_RIGHT)
-
-    # meshes in Parkinson Template referential
-    self.parkRefMeshElectrodeLeftPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_LEFT)
-    self.parkRefMeshElectrodeRightPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_RIGHT)
-    self.parkRefMeshElectrodeModelLeftAxisPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_MODEL_AXIS_LEFT)
-    self.parkRefMeshElectrodeModelLeftContactsPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_MODEL_CONTACTS_LEFT)
-    self.parkRefMeshElectrodeModelRightAxisPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_MODEL_AXIS_RIGHT)
-    self.parkRefMeshElectrodeModelRightContactsPath = os.path.join(self.meshParkRefDir,self.idString+'_'+const.REF_PARK+'_'+const.MESH_ELECTRODE_MODEL_CONTACTS_RIGHT)
-
-    # masked images
-    self.maskedT1mriBrainPath = os.path.join(self.maskedDir,self.idString+'_'+const.MASKED_T1MRI_BRAIN)
-    self.maskedT1MriHeadPath = os.path.join(self.maskedDir,self.idString+'_'+const.MASKED_T1MRI_HEAD)
-    self.maskedCtPostCortexLeftPath = os.path.join(self.maskedDir,self.idString+'_'+const.MASKED_CTPOST_CORTEX_LEFT)
-    self.maskedCtPostCortexRightPath = os.path.join(self.maskedDir,self.idString+'_'+const.MASKED_CTPOST_CORTEX_RIGHT)
-
-    # MRML scenes
-    self.sceneInclusionPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_INCLUSION)
-    self.MITKsceneInclusionPath = os.path.join(self.mitkDir,self.idString+'_'+const.MRML_SCENE_INCLUSION)
-    self.scenePreOpPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_PREOP)
-    self.scenePreOpPitiePath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_PREOP_PITIE)
-    self.scenePreOpElectrodeLeftPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_PREOP_ELECTRODE_LEFT)
-    self.scenePreOpElectrodeRightPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_PREOP_ELECTRODE_RIGHT)
-    self.scenePostOpPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_POSTOP)
-    self.scenePostOpElectrodeLeftPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_POSTOP_ELECTRODE_LEFT)
-    self.scenePostOpElectrodeRightPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_POSTOP_ELECTRODE_RIGHT)
-    self.scenePostOpVoltagePath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_POSTOP_VOLTAGE)
-    self.sceneYeBPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_YEB)
-
-    # color tables
-    self.parkinsonColorTablePath = os.path.join(self.colorTableDir,self.idString+'_'+const.PARK_COLOR_TABLE)
-    self.voltageColorTablePath = os.path.join(self.colorTableDir,self.idString+'_'+const.VOLTAGE_COLOR_TABLE)
-    self.yebColorTablePath = os.path.join(self.colorTableDir,self.idString+'_'+const.YEB_COLOR_TABLE)
-
-    # clinical template volume
-    self.clinicalNoCriteriaVolumePath = os.path.join(self.templateDir,'clinical_atlas.nii.gz')
-
-    # trajectories
-    self.inclusionTrajectoryManualPath = os.path.join(self.trajectoryDir,self.idString+'_'+const.INCLUSION_TRAJECTORY_MANUAL)
-    self.inclusionTrajectoryAutomaticPath = os.path.join(self.trajectoryDir,self.idString+'_'+const.INCLUSION_TRAJECTORY_AUTOMATIC)
-    self.leksellTrajectoryPath = os.path.join(self.trajectoryDir,self.idString+'_'+const.LEKSELL_TRAJECTORY)
-
-
-    # intialise reference MRI
-    if os.path.exists(self.t1mriIncPath):
-      self.refMriIsInclusion = True
+    self.manifest = None
+
+
+  def __getattr__(self, name):
+    if name in DIRECTORIES_MAP:
+      parent, dirName = DIRECTORIES_MAP[name]
+      value = os.path.join(getattr(self, parent), dirName)
+    elif name in FILES_MAP:
+      directory, fileName = FILES_MAP[name]
+      value = os.path.join(getattr(self, directory), fileName.format(id=self.idString))
+    elif name in PRESENCE_FLAGS_MAP:
+      path = getattr(self, PRESENCE_FLAGS_MAP[name])
+      if self.manifest is not None:
+        value = self.manifest.exists(path)
+      else:
+        value = os.path.exists(path)
     else:
-      self.refMriIsInclusion = False
-
-    if os.path.exists(self.t2mriPath):
-      self.t2MriPresent = True
-    else:
-      self.t2MriPresent = False
-
-    if os.path.exists(self.t2mri1mmPath):
-      self.t2Mri1mmPresent = True
-    else:
-      self.t2Mri1mmPresent = False
-
-    # Normalization
-    self.inverseDeformationFieldPath  = os.path.join(self.normalizationDir, INVERSE_WARP  + self.idString+'_'+const.MASKED_T1MRI_HEAD).rstrip('.gz')
-    self.normalizedT1MriPath          = os.path.join(self.normalizationDir, NORMALIZED_T1 + self.idString+'_'+const.MASKED_T1MRI_HEAD).rstrip('.gz')
-    self.maskedHeadUnbiasedPath = os.path.join(self.maskedDir, self.idString+'_'+const.MASKED_T1MRI_HEAD_UNBIASED)
-    self.normalizationFieldPath = os.path.join(self.normalizationDir, self.idString+'_'+const.NORMALIZATION_FIELD)
-    self.normalizationFieldInvertedPath = os.path.join(self.normalizationDir, self.idString+'_'+const.NORMALIZATION_FIELD_INVERTED)
-    self.regImaCtPost2MNIPath = os.path.join(self.normalizationDir, 'w' + self.idString+'_'+const.REGIMA_CTPOST2T1MRI).rstrip('.gz')
-    self.regImaT1MriPost2MNIPath = os.path.join(self.normalizationDir, 'w' + self.idString+'_'+REGIMA_T1MRIPOST2T1MRI).rstrip('.gz')
-    self.regImaT1MriPre2MNIPath = os.path.join(self.normalizationDir, 'w' + self.idString+'_'+const.IMA_T1MRI_PRE).rstrip('.gz')
-    self.mniRefMaskHeadPath = os.path.join(self.normalizationDir, 'w' + self.idString+'_'+const.MASK_HEAD)
-
-
-    self.localizationsPath = os.path.join(self.dataDir, self.idString+'_'+ANATOMICAL_LOCALIZATIONS)
-
-    # masks in CT-POST referential
-    self.ctPostRefMaskElectrodesPath = os.path.join(self.maskCtPostRefDir, self.idString+'_'+const.REF_CTPOST+'_'+MASK_ELECTRODES)
-
-    # meshes
-    self.meshShaftsPath = os.path.join(self.meshElectrodesDir, self.idString+'_shafts.vtk')
-    self.meshScrewsPath = os.path.join(self.meshElectrodesDir, self.idString+'_screws.vtk')
-
-    # meshes in CT POST referential
-    self.ctPostRefMeshElectrodesPath = os.path.join(self.meshCtPostRefDir, self.idString+'_'+const.REF_CTPOST+'_'+MESH_ELECTRODES)
-    self.meshACFramePath = os.path.join(self.meshCtPostRefDir, self.idString+'_'+const.REF_CTPOST+MESH_AC+'_frame.vtk')
-    self.meshPCFramePath = os.path.join(self.meshCtPostRefDir, self.idString+'_'+const.REF_CTPOST+MESH_PC+'_frame.vtk')
-
-    # MRML scene
-    self.scenePath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_POSTOP)
-    self.sceneMNIPath = os.path.join(self.slicerSceneDir,self.idString+'_'+const.MRML_SCENE_MNI)
-
-    # trajectories information
-    self.trajectoriesPath = os.path.join(self.trajectoriesDir, self.idString+'_'+TRAJECTORIES)
-
-    self.electrodesPath = os.path.join(self.dataDir, self.idString+'_'+ELECTRODES_OBJECT)
-    self.labeledDir = os.path.join(self.maskCtPostRefDir, 'labeled')
-
-    self.ctPostRefMaskHeadPath = os.path.join(self.maskCtPostRefDir, self.idString+'_'+const.REF_CTPOST+'_'+const.MASK_HEAD)
-    self.labeledElectrodesPath = os.path.join(self.labeledDir, self.idString+'_labeledElectrodes.nii.gz')
-
-    # results
-    self.coordinatesPath = os.path.join(self.dataDir, self.idString+'_'+ANATOMICAL_LOCALIZATIONS)
-
-    self.xmlPath = os.path.join(self.dataDir, self.idString+'_'+ELECTRODES_XML)
-    self.xmlVerifiedPath = self.xmlPath.replace('.xml', '_verified.xml')
-
-    self.statsPath = os.path.join(self.dataDir, self.idString+'_' + STATS)
-
-    self.templatesDir = os.path.join(self.dataDir, 'templates')
-    self.templateDartelPath = os.path.join(self.templatesDir, 'avgT1_Dartel_IXI550_MNI152.nii')
-    self.templatePath = os.path.join(self.templatesDir, 'T1.nii')
-
-
-
+      raise AttributeError(name)
+    self.__dict__[name] = value
+    return value
+
+
+  def getArtifactNames(self):
+    """
+    Returns the attribute names of all the files of the patient
+    """
+    return [name for name, _, _ in FILES]
+
+
+  def getDirectoryNames(self):
+    """
+    Returns the attribute names of all the directories of the patient
+    """
+    return ['dataDir'] + [name for name, _, _ in DIRECTORIES]
+
+
+  def getPaths(self, names=None):
+    """
+    Resolves many paths at once
+
+    :param names: attribute names, all the files of the patient if None
+    :returns: dictionary mapping attribute names to paths
+    """
+    if names is None:
+      names = self.getArtifactNames()
+    return dict((name, getattr(self, name)) for name in names)
+
+
+  def getManifest(self, refresh=False):
+    """
+    Returns the manifest of the files of the patient, scanning the patient directory on first call
+
+    :param refresh: scan the directory again
+    """
+    if self.manifest is None or refresh:
+      self.manifest = PatientManifest(self)
+    return self.manifest
+
+
+
+def scanDirectory(directory):
+  """
+  Lists a directory, yielding (name, path, isDirectory, stat) for each entry.
+  Directory entries are not stat'ed.
+  """
+  if scandir is not None:
+    for entry in scandir(directory):
+      isDirectory = entry.is_dir()
+      yield entry.name, entry.path, isDirectory, None if isDirectory else entry.stat()
+  else:
+    for name in os.listdir(directory):
+      path = os.path.join(directory, name)
+      isDirectory = os.path.isdir(path)
+      yield name, path, isDirectory, None if isDirectory else os.stat(path)
+
+
+
+class PatientManifest:
+  """
+  Presence, size and modification time of the files of a patient, gathered by listing
+  each existing directory of the patient once. Queries do not touch the filesystem.
+  """
+  def __init__(self, model):
+    self.model = model
+    self.files = {}
+    self.directoryMTimes = {}
+    self.scan()
+
+
+  def scan(self):
+    self.files = {}
+    self.directoryMTimes = {}
+    knownDirectories = set(self.model.getPaths(self.model.getDirectoryNames()).values())
+    try:
+      self.directoryMTimes[self.model.dataDir] = os.stat(self.model.dataDir).st_mtime
+    except OSError:
+      return
+    pending = [self.model.dataDir]
+    while pending:
+      directory = pending.pop()
+      for name, path, isDirectory, stat in scanDirectory(directory):
+        if isDirectory:
+          if path in knownDirectories:
+            self.directoryMTimes[path] = os.stat(path).st_mtime
+            pending.append(path)
+        else:
+          self.files[path] = stat.st_size, stat.st_mtime
+
+
+  def getPath(self, nameOrPath):
+    if nameOrPath in FILES_MAP:
+      return getattr(self.model, nameOrPath)
+    return nameOrPath
+
+
+  def exists(self, nameOrPath):
+    """
+    :param nameOrPath: attribute name of the patient model or path
+    """
+    path = self.getPath(nameOrPath)
+    return path in self.files or path in self.directoryMTimes
+
+
+  def getEntry(self, nameOrPath):
+    """
+    Returns a dictionary with the keys 'path', 'exists', 'size' and 'mtime'.
+    Size and modification time are None if the file does not exist.
+    """
+    path = self.getPath(nameOrPath)
+    size, mtime = self.files.get(path, (None, None))
+    return {'path': path, 'exists': path in self.files, 'size': size, 'mtime': mtime}
+
+
+  def getFirstExisting(self, namesOrPaths):
+    """
+    Returns the path of the first existing file, or None
+    """
+    for nameOrPath in namesOrPaths:
+      if self.exists(nameOrPath):
+        return self.getPath(nameOrPath)
+    return None
+
+
+  def getArtifacts(self):
+    """
+    Returns a dictionary mapping each file attribute name of the patient model to its entry
+    """
+    return dict((name, self.getEntry(name)) for name in self.model.getArtifactNames())
+
+
+  def isOutdated(self):
+    """
+    Returns True if any of the scanned directories has been modified since the scan
+    """
+    for directory, mtime in self.directoryMTimes.items():
+      try:
+        if os.stat(directory).st_mtime != mtime:
+          return True
+      except OSError:
+        return True
+    return False
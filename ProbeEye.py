@@ -0,0 +1,202 @@
+import os
+import json
+
+import numpy as np
+
+import ImageUtils
+import Reslicer
+from Electrode import REFORMAT_TYPES
+import epiloc_constants as const
+
+CACHE_VERSION = 1
+SLICE_SIZE = 128  # pixels
+SLICE_SPACING = 0.5  # mm
+
+
+class ProbeEyeStack:
+    """
+    Stack of slices perpendicular to an electrode, from its target point to the tip of the screw,
+    resampled once from a volume. The slices at any distance along the electrode are then
+    interpolated from this small array instead of reslicing the whole volume.
+    """
+
+    def __init__(self, stack, ijkToRAS):
+        """
+        :param stack: array indexed as (slice, row, column). The first slice contains the target point.
+        :param ijkToRAS: 4x4 matrix mapping (column, row, slice) indices to RAS
+        """
+        self.stack = stack
+        self.ijkToRAS = np.asarray(ijkToRAS, np.float64)
+        self.sliceSpacing = np.linalg.norm(self.ijkToRAS[:3, 2])
+
+
+    def __repr__(self):
+        return "Probe's eye stack %s" % (self.stack.shape,)
+
+
+    @classmethod
+    def compute(cls, array, affine, electrode, toVolumeMatrix=None, size=SLICE_SIZE, spacing=SLICE_SPACING):
+        """
+        Resamples the stack of an electrode from a volume
+
+        :param array: volume indexed as (i, j, k)
+        :param affine: 4x4 matrix mapping voxel indices to RAS
+        :param electrode: Electrode
+        :param toVolumeMatrix: 4x4 matrix from the space of the electrode to the space of the volume
+        :param size: side of the slices in pixels
+        :param spacing: distance between slices in mm
+        """
+        axial = REFORMAT_TYPES.index(const.SLICE_TYPE_AXIAL)
+        rotation = electrode.getReformatFrames()[0, axial, :3, :3]
+        xAxis, yAxis, direction = rotation.T
+        fieldOfView = electrode.getFieldOfView()[1]
+        pixelSize = fieldOfView / float(size)
+        numSlices = int(np.ceil(electrode.getLength(screw=True) / spacing)) + 1
+
+        ijkToRAS = np.identity(4)
+        ijkToRAS[:3, 0] = xAxis * pixelSize
+        ijkToRAS[:3, 1] = -yAxis * pixelSize  # the first row is the top of the slice
+        ijkToRAS[:3, 2] = direction * spacing
+        ijkToRAS[:3, 3] = electrode.getTargetPoint() - (xAxis - yAxis) * (fieldOfView - pixelSize) / 2
+
+        toVoxels = np.linalg.inv(affine)
+        if toVolumeMatrix is not None:
+            toVoxels = np.dot(toVoxels, toVolumeMatrix)
+        toVoxels = np.dot(toVoxels, ijkToRAS)
+        stack = np.empty((numSlices, size, size), np.float32)
+        rows, columns = np.mgrid[:size, :size]
+        sliceIndices = np.column_stack((columns.ravel(), rows.ravel(), np.zeros(size * size)))
+        for k in range(numSlices):
+            sliceIndices[:, 2] = k
+            voxels = ImageUtils.applyAffine(sliceIndices, toVoxels)
+            stack[k] = ImageUtils.interpolateTrilinear(array, voxels, fillValue=0).reshape(size, size)
+        return cls(stack, ijkToRAS)
+
+
+    def getSlice(self, distance):
+        """
+        Returns the slice at a distance from the target point along the electrode,
+        interpolated between the two closest slices of the stack
+
+        :param distance: distance in mm
+        """
+        position = np.clip(distance / self.sliceSpacing, 0, len(self.stack) - 1)
+        below = int(np.floor(position))
+        above = min(below + 1, len(self.stack) - 1)
+        weight = position - below
+        return (1 - weight) * self.stack[below] + weight * self.stack[above]
+
+
+    def getSliceIJKToRAS(self, distance):
+        """
+        Returns the 4x4 matrix mapping the (column, row, 0) indices of the slice returned
+        by getSlice to RAS, so that the slice can be shown as a single-slice volume
+        """
+        position = np.clip(distance / self.sliceSpacing, 0, len(self.stack) - 1)
+        ijkToRAS = self.ijkToRAS.copy()
+        ijkToRAS[:3, 3] += position * ijkToRAS[:3, 2]
+        return ijkToRAS
+
+
+    @staticmethod
+    def getCachePaths(cacheDir, electrode):
+        basePath = os.path.join(cacheDir, electrode.name + '_probe_eye')
+        return basePath + '.npy', basePath + '.json'
+
+
+    @staticmethod
+    def getCacheKey(volumePath, electrode, toVolumeMatrix, size, spacing):
+        matrix = np.identity(4) if toVolumeMatrix is None else toVolumeMatrix
+        centers = [[None if np.isnan(x) else x for x in center] for center in np.round(electrode.centers, 4).tolist()]
+        return {'version': CACHE_VERSION,
+                'volume': os.path.abspath(volumePath),
+                'volumeMTime': os.path.getmtime(volumePath),
+                'centers': centers,  # NaN is not equal to itself
+                'matrix': np.round(matrix, 6).tolist(),
+                'size': size,
+                'spacing': spacing}
+
+
+    @classmethod
+    def read(cls, cacheDir, electrode, key):
+        """
+        Memory-maps the cached stack of an electrode, if it is up to date
+
+        :returns: ProbeEyeStack or None
+        """
+        stackPath, sidecarPath = cls.getCachePaths(cacheDir, electrode)
+        if not os.path.exists(sidecarPath):
+            return None
+        with open(sidecarPath) as f:
+            sidecar = json.load(f)
+        if sidecar['key'] != json.loads(json.dumps(key)):
+            return None
+        return cls(np.load(stackPath, mmap_mode='r'), sidecar['ijkToRAS'])
+
+
+    def write(self, cacheDir, electrode, key):
+        """
+        Writes the stack and a JSON sidecar holding its geometry and cache key.
+        The sidecar is written last, so a partially written cache is never used.
+        """
+        stackPath, sidecarPath = self.getCachePaths(cacheDir, electrode)
+        try:
+            if not os.path.exists(cacheDir):
+                os.makedirs(cacheDir)
+            for path in sidecarPath, stackPath:  # os.rename does not overwrite on Windows
+                if os.path.exists(path):
+                    os.remove(path)
+            tempStackPath = stackPath + '.%d.tmp' % os.getpid()
+            with open(tempStackPath, 'wb') as f:
+                np.save(f, np.asarray(self.stack))
+            os.rename(tempStackPath, stackPath)
+            tempSidecarPath = sidecarPath + '.%d.tmp' % os.getpid()
+            with open(tempSidecarPath, 'w') as f:
+                json.dump({'key': key, 'ijkToRAS': self.ijkToRAS.tolist()}, f)
+            os.rename(tempSidecarPath, sidecarPath)
+        except (IOError, OSError):
+            pass  # the cache is only an optimization, e.g. the patient folder may be read-only
+
+
+    @classmethod
+    def get(cls, volume, volumePath, electrode, cacheDir, toVolumeMatrix=None, size=SLICE_SIZE, spacing=SLICE_SPACING):
+        """
+        Returns the stack of an electrode from the cache, computing and caching it if needed
+
+        :param volume: tuple (array, affine) of the volume, or a function returning it,
+        so that the volume is only read if the stack is not cached
+        """
+        key = cls.getCacheKey(volumePath, electrode, toVolumeMatrix, size, spacing)
+        probeEyeStack = cls.read(cacheDir, electrode, key)
+        if probeEyeStack is None:
+            if callable(volume):
+                volume = volume()
+            array, affine = volume
+            probeEyeStack = cls.compute(array, affine, electrode, toVolumeMatrix, size, spacing)
+            probeEyeStack.write(cacheDir, electrode, key)
+        return probeEyeStack
+
+
+
+def computeProbeEyeStacks(electrodes, volumePath, cacheDir, toVolumeMatrix=None, getVolume=None):
+    """
+    Sets the probe's eye stack of every electrode with a known trajectory, as soon as it is ready.
+    The volume is read at most once, only if a stack is not cached. This is meant to be run in a background thread.
+
+    :param electrodes: list of Electrode
+    :param volumePath: path to the volume, e.g. the postoperative CT. It is also part of the cache key
+    :param cacheDir: directory where the stacks are cached
+    :param toVolumeMatrix: 4x4 matrix from the space of the electrodes to the space of the volume
+    :param getVolume: function returning the tuple (array, affine) of the volume, e.g. to reuse
+    a volume that has already been read. By default the volume is read from volumePath
+    """
+    volume = []
+
+    def getCachedVolume():
+        if not volume:
+            volume.append(Reslicer.readVolume(volumePath) if getVolume is None else getVolume())
+        return volume[0]
+
+    for electrode in electrodes:
+        if electrode.getDirection() is not None:
+            electrode.probeEyeStack = ProbeEyeStack.get(getCachedVolume, volumePath, electrode, cacheDir, toVolumeMatrix)
@@ -0,0 +1,171 @@
+import os
+import sys
+import zlib
+import struct
+from multiprocessing import Pool
+
+import numpy as np
+
+import ImageUtils
+import PatientModelEpilepsy
+from ElectrodesIO import ElectrodesReader
+from Electrode import REFORMAT_TYPES
+
+PANEL_SIZE = 256  # pixels
+PANEL_GAP = 4  # pixels
+PANELS_DIRNAME = 'reformat_panels'
+
+
+def readVolume(volumePath):
+    """
+    Reads a scalar volume. Uncompressed NIfTI volumes are memory-mapped,
+    so the processes reslicing the same volume share its pages. The intensity
+    scaling of the NIfTI header is ignored, as the panels are windowed anyway.
+
+    :returns: tuple (array indexed as (i, j, k), affine)
+    """
+    if volumePath.endswith('.nii'):
+        array, affine, _scaling = ImageUtils.memmapNifti(volumePath)
+    else:
+        array, affine = ImageUtils.readImageArray(volumePath)
+    if array.ndim > 3:
+        array = array.reshape(array.shape[:3], order='F')
+    return array, affine
+
+
+def resliceVolume(array, affine, frame, fieldOfView, size=PANEL_SIZE):
+    """
+    Samples a volume on an oblique plane, like a Slicer slice view whose SliceToRAS matrix is frame
+
+    :param array: volume indexed as (i, j, k)
+    :param affine: 4x4 matrix mapping voxel indices to RAS
+    :param frame: 4x4 matrix whose columns are the x and y axes of the slice, its normal and its center
+    :param fieldOfView: side of the slice in mm
+    :param size: side of the image in pixels
+    :returns: (size, size) array whose first row is the top of the slice. Pixels outside the volume are 0.
+    """
+    coordinates = (np.arange(size) + 0.5) * fieldOfView / size - fieldOfView / 2.
+    u, v = np.meshgrid(coordinates, coordinates[::-1])
+    points = frame[:3, 3] + np.outer(u.ravel(), frame[:3, 0]) + np.outer(v.ravel(), frame[:3, 1])
+    voxels = ImageUtils.applyAffine(points, np.linalg.inv(affine))
+    return ImageUtils.interpolateTrilinear(array, voxels, fillValue=0).reshape(size, size)
+
+
+def toUint8(image, percentiles=(1, 99)):
+    """
+    Maps an image to 8 bits, saturating the intensities outside the given percentiles
+    """
+    low, high = np.percentile(image, percentiles)
+    if high <= low:
+        return np.zeros(image.shape, np.uint8)
+    scaled = (np.clip(image, low, high) - low) * (255. / (high - low))
+    return scaled.round().astype(np.uint8)
+
+
+def writePNG(path, image):
+    """
+    Writes a 2D uint8 array as a grayscale PNG image
+    """
+    image = np.asarray(image, np.uint8)
+    height, width = image.shape
+    scanlines = np.hstack((np.zeros((height, 1), np.uint8), image))  # filter type 0 on every row
+
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes())))
+        f.write(chunk(b'IEND', b''))
+
+
+def getElectrodePanel(array, affine, electrode, plotNumber=1, size=PANEL_SIZE):
+    """
+    Returns the axial, sagittal and coronal reformatted slices of an electrode side by side
+
+    :param electrode: Electrode, with its centers in the space of the volume
+    :param plotNumber: plot crossed by the axial slice
+    :returns: uint8 array of shape (size, 3 * size + 2 * PANEL_GAP)
+    """
+    fieldOfView = electrode.getFieldOfView()[1]
+    frames = electrode.getReformatFrames()[plotNumber - 1]
+    slices = [resliceVolume(array, affine, frame, fieldOfView, size) for frame in frames]
+    image = toUint8(np.hstack(slices))
+    panel = np.zeros((size, len(REFORMAT_TYPES) * (size + PANEL_GAP) - PANEL_GAP), np.uint8)
+    for i in range(len(REFORMAT_TYPES)):
+        start = i * (size + PANEL_GAP)
+        panel[:, start:start+size] = image[:, i*size:(i+1)*size]
+    return panel
+
+
+def makePatientPanels(job):
+    """
+    Writes one panel per electrode of a patient
+
+    :param job: tuple (volumePath, electrodesPath, outputDir)
+    :returns: list of paths of the written images
+    """
+    volumePath, electrodesPath, outputDir = job
+    array, affine = readVolume(volumePath)
+    electrodes = ElectrodesReader().getElectrodes(electrodesPath)
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    paths = []
+    for electrode in electrodes:
+        if len(electrode.centers) < 2:
+            continue
+        panel = getElectrodePanel(array, affine, electrode)
+        path = os.path.join(outputDir, electrode.name + '.png')
+        writePNG(path, panel)
+        paths.append(path)
+    return paths
+
+
+def makePanels(jobs, numProcesses=None):
+    """
+    Writes the panels of many patients in a pool of processes
+
+    :param jobs: list of (volumePath, electrodesPath, outputDir) tuples
+    :param numProcesses: size of the pool. Defaults to the number of CPUs
+    :returns: list of paths of the written images
+    """
+    pool = Pool(numProcesses)
+    try:
+        results = pool.map(makePatientPanels, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return [path for paths in results for path in paths]
+
+
+def getCohortJobs(patientsDir, outputDir):
+    """
+    Returns a job per patient of a patients directory that has a postoperative CT and electrodes
+
+    :param outputDir: the panels of each patient are written in a subdirectory named as the patient.
+    It should not be inside patientsDir, or it would be scanned as a patient.
+    """
+    import CohortScanner
+    scanner = CohortScanner.CohortScanner(patientsDir)
+    scanner.scan()
+    jobs = []
+    for patientId in scanner.getPatientsWith('ctPostPath'):
+        model = PatientModelEpilepsy.PatientModelEpilepsy(patientId, rootDir=patientsDir)
+        artifacts = scanner.patients[patientId]['artifacts']
+        names = [name for name in ('xmlVerifiedPath', 'xmlPath') if name in artifacts]
+        if names:
+            jobs.append((model.ctPostPath, getattr(model, names[0]), os.path.join(outputDir, patientId)))
+    return jobs
+
+
+
+if __name__ == '__main__':
+    patientsDir = sys.argv[1]
+    # By default the panels are written next to the patients directory, not inside it,
+    # so that the output directory is not scanned as a patient
+    defaultOutputDir = os.path.normpath(os.path.abspath(patientsDir)) + '_' + PANELS_DIRNAME
+    outputDir = sys.argv[2] if len(sys.argv) > 2 else defaultOutputDir
+    paths = makePanels(getCohortJobs(patientsDir, outputDir))
+    print('%d panels written to %s' % (len(paths), outputDir))
@@ -0,0 +1,185 @@
+import numpy as np
+
+import ImageUtils
+from Implant import composeAffines
+
+CT_PRE = 'ct_pre'
+CT_POST = 'ct_post'
+T1MRI = 't1mri'
+T1MRI_POST = 't1mri_post'
+T2MRI = 't2mri'
+T2MRI_INTERLACED = 't2mri_interlaced'
+ACPC = 'acpc'
+PARK = 'park'
+FRAME = 'frame'
+YEB_LH = 'yeb_lh'
+YEB_RH = 'yeb_rh'
+
+WORLD2WORLD = 'w2w'
+SLICER = 'slicer'
+
+# (attribute of PatientModelEpilepsy, convention, source space, target space)
+# The FSL matrices are not included because they map voxels, not world coordinates
+TRANSFORMS = (
+    ('regMatW2WT1Mri2CtPrePath', WORLD2WORLD, T1MRI, CT_PRE),
+    ('regMatW2WT1Mri2T1MriPostPath', WORLD2WORLD, T1MRI, T1MRI_POST),
+    ('regMatW2WT1MriPost2T1MriPath', WORLD2WORLD, T1MRI_POST, T1MRI),
+    ('regMatW2WT1Mri2CtPostPath', WORLD2WORLD, T1MRI, CT_POST),
+    ('regMatW2WT1Mri2ParkPath', WORLD2WORLD, T1MRI, PARK),
+    ('regMatW2WT1Mri2ACPCPath', WORLD2WORLD, T1MRI, ACPC),
+    ('regMatW2WLHT1Mri2AtlasYEBPath', WORLD2WORLD, T1MRI, YEB_LH),
+    ('regMatW2WRHT1Mri2AtlasYEBPath', WORLD2WORLD, T1MRI, YEB_RH),
+    ('regMatW2WT2Mri2T1MriPath', WORLD2WORLD, T2MRI, T1MRI),
+    ('regMatW2WT2Mri2ParkPath', WORLD2WORLD, T2MRI, PARK),
+    ('regMatW2WT2Mri2ACPCPath', WORLD2WORLD, T2MRI, ACPC),
+    ('regMatW2WInterlacedT2Mri2T1MriPath', WORLD2WORLD, T2MRI_INTERLACED, T1MRI),
+    ('regMatW2WInterlacedT2Mri2ACPCPath', WORLD2WORLD, T2MRI_INTERLACED, ACPC),
+    ('regMatW2WCtPre2T1MriPath', WORLD2WORLD, CT_PRE, T1MRI),
+    ('regMatW2WCtPre2ACPCPath', WORLD2WORLD, CT_PRE, ACPC),
+    ('regMatW2WCtPost2ParkPath', WORLD2WORLD, CT_POST, PARK),
+    ('regMatW2WCtPost2CtPrePath', WORLD2WORLD, CT_POST, CT_PRE),
+    ('regMatW2WCtPost2T1MriPath', WORLD2WORLD, CT_POST, T1MRI),
+    ('regMatW2WCtPost2ACPCPath', WORLD2WORLD, CT_POST, ACPC),
+    ('regMatW2WT1MriPost2ACPCPath', WORLD2WORLD, T1MRI_POST, ACPC),
+    ('regMatW2WFrame2CtPrePath', WORLD2WORLD, FRAME, CT_PRE),
+    ('regMatW2WFrame2ACPCPath', WORLD2WORLD, FRAME, ACPC),
+    ('regMatW2WPark2T1MriPath', WORLD2WORLD, PARK, T1MRI),
+    ('regMatW2WAtlasYEB2LHT1MriPath', WORLD2WORLD, YEB_LH, T1MRI),
+    ('regMatW2WAtlasYEB2RHT1MriPath', WORLD2WORLD, YEB_RH, T1MRI),
+    ('regMatSlicerT1Mri2ACPCPath', SLICER, T1MRI, ACPC),
+    ('regMatSlicerT2Mri2ACPCPath', SLICER, T2MRI, ACPC),
+    ('regMatSlicerInterlacedT2Mri2ACPCPath', SLICER, T2MRI_INTERLACED, ACPC),
+    ('regMatSlicerCtPre2ACPCPath', SLICER, CT_PRE, ACPC),
+    ('regMatSlicerCtPost2ACPCPath', SLICER, CT_POST, ACPC),
+    ('regMatSlicerFrame2ACPCPath', SLICER, FRAME, ACPC),
+    ('regMatSlicerPark2ACPCPath', SLICER, PARK, ACPC),
+    ('regMatSlicerAtlasYEB2LHT1MriPath', SLICER, YEB_LH, T1MRI),
+    ('regMatSlicerAtlasYEB2RHT1MriPath', SLICER, YEB_RH, T1MRI),
+    ('regMatSlicerT1MriPost2ACPCPath', SLICER, T1MRI_POST, ACPC),
+)
+
+
+def readWorldToWorldMatrix(path):
+    """
+    Reads a 4x4 matrix mapping RAS world coordinates, written as plain text
+    """
+    return np.loadtxt(path).reshape(4, 4)
+
+
+def readSlicerMatrix(path):
+    """
+    Reads a linear transform written by Slicer in ITK format and returns
+    the 4x4 matrix Slicer applies to the points of the transformed nodes (RAS).
+    ITK stores the transform from the parent in LPS, so the matrix is converted and inverted.
+    """
+    parameters = fixedParameters = None
+    with open(path) as f:
+        for line in f:
+            if line.startswith('Parameters:') and parameters is None:
+                parameters = np.array(line.split(':', 1)[1].split(), np.float64)
+            elif line.startswith('FixedParameters:') and fixedParameters is None:
+                fixedParameters = np.array(line.split(':', 1)[1].split(), np.float64)
+    if parameters is None or len(parameters) != 12:
+        raise ValueError('%s does not contain a 3D linear transform' % path)
+    if fixedParameters is None:
+        fixedParameters = np.zeros(3)
+    rotation = parameters[:9].reshape(3, 3)
+    center = fixedParameters[:3]
+    fromParentLPS = np.identity(4)
+    fromParentLPS[:3, :3] = rotation
+    fromParentLPS[:3, 3] = parameters[9:] + center - np.dot(rotation, center)
+    fromParent = np.dot(ImageUtils.LPS_TO_RAS, np.dot(fromParentLPS, ImageUtils.LPS_TO_RAS))
+    return np.linalg.inv(fromParent)
+
+
+READERS = {WORLD2WORLD: readWorldToWorldMatrix,
+           SLICER: readSlicerMatrix}
+
+
+
+class TransformGraph:
+    """
+    Coordinate spaces of a patient connected by the registration matrices found in their folder.
+    The matrix between two spaces is composed along the shortest chain of registrations,
+    inverting them when needed, and memoized.
+    """
+
+    def __init__(self, model, conventions=(SLICER, WORLD2WORLD)):
+        """
+        :param model: PatientModelEpilepsy
+        :param conventions: conventions of the matrices used as edges of the graph, in order of preference
+        """
+        self.model = model
+        self.matrices = {}
+        self.edges = {}
+        manifest = model.getManifest()
+        for convention in conventions:
+            for name, transformConvention, source, target in TRANSFORMS:
+                if transformConvention != convention or not manifest.exists(name):
+                    continue
+                if target in self.edges.get(source, {}):
+                    continue  # a previous convention already connects these spaces
+                self.edges.setdefault(source, {})[target] = name, False
+                self.edges.setdefault(target, {})[source] = name, True
+
+
+    def __repr__(self):
+        return 'Transform graph %s (%s)' % (self.model.idString, ', '.join(sorted(self.edges)))
+
+
+    def getSpaces(self):
+
+        return sorted(self.edges)
+
+
+    def findPath(self, source, target):
+        """
+        Returns the list of spaces from source to target with the fewest registrations, or None
+        """
+        previous = {source: None}
+        queue = [source]
+        for space in queue:
+            if space == target:
+                path = []
+                while space is not None:
+                    path.append(space)
+                    space = previous[space]
+                return path[::-1]
+            for neighbour in sorted(self.edges.get(space, {})):
+                if neighbour not in previous:
+                    previous[neighbour] = space
+                    queue.append(neighbour)
+        return None
+
+
+    def readEdgeMatrix(self, source, target):
+        name, inverse = self.edges[source][target]
+        convention = [c for n, c, s, t in TRANSFORMS if n == name][0]
+        matrix = READERS[convention](getattr(self.model, name))
+        if inverse:
+            matrix = np.linalg.inv(matrix)
+        return matrix
+
+
+    def getMatrix(self, source, target):
+        """
+        Returns the 4x4 matrix mapping RAS points from the source space to the target space
+
+        :param source: space like TransformGraph.CT_POST
+        :param target: space like TransformGraph.T1MRI
+        """
+        key = source, target
+        if key not in self.matrices:
+            path = self.findPath(source, target)
+            if path is None:
+                raise KeyError('No registration links %s to %s' % key)
+            affines = [self.readEdgeMatrix(a, b) for a, b in zip(path[:-1], path[1:])]
+            self.matrices[key] = composeAffines(affines)
+        return self.matrices[key]
+
+
+    def transformPoints(self, points, source, target):
+        """
+        Maps an (N, 3) array of RAS points from the source space to the target space
+        """
+        return ImageUtils.applyAffine(points, self.getMatrix(source, target))
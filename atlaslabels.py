@@ -1,44 +1,18 @@
 import os
+import json
 import xml.etree.ElementTree as ET
 
 import numpy as np
 
+import ImageUtils
+import epiloc_constants as const
+
 codeDir = os.path.dirname(__file__)
 templatesDir = os.path.join(codeDir, '..', 'templates')
+cacheDir = os.environ.get('EPILOC_ATLAS_CACHE', os.path.join(templatesDir, 'cache'))
+CACHE_VERSION = 1
 
-def isSlicerPython():
-    """
-    Returns True if the code is believed to be executed from within the Slicer's internal Python.
-    Tipically this happens when we import a module from a Slicer scripted plugin
-    """
-    return True
-    return os.environ.get("PYTHONHOME") is not None and os.environ.get("PYTHONHOME").find('Slicer')>-1
-
-
-if isSlicerPython():
-    import SimpleITK as sitk
-else:
-    import nibabel as nib
-
-
-def readImageITK(imagePath):
-    im = sitk.ReadImage(imagePath)
-    direction = np.array(im.GetDirection())
-    direction[0:3] *= -1
-    direction[3:6] *= -1
-    im.SetDirection(tuple(direction))
-    origin = np.array(im.GetOrigin())
-    origin[:2] *= -1
-    im.SetOrigin(tuple(origin))
-    return im
-
-
-def readImageNibabel(imagePath):
-    nii = nib.load(imagePath)
-    data = nii.get_data()
-    affine = nii.get_affine()
-    return data, affine
-
+NO_LABEL = 'No label found in the atlas for this point'
 
 
 class AtlasReader:
@@ -66,41 +40,162 @@ class AtlasReader:
         return self.yeoAtlas.getLabel(worldCoordinates)
 
 
+    def getAtlas(self, atlasName):
+        """
+        Returns the atlas corresponding to the name, loading it if needed
+
+        :param atlasName: one of const.TALAIRACH, const.AAL or const.YEO
+        """
+        if atlasName == const.TALAIRACH:
+            if self.talairachAtlas is None:
+                self.talairachAtlas = TalairachAtlas()
+            return self.talairachAtlas
+        elif atlasName == const.AAL:
+            if self.aalAtlas is None:
+                self.aalAtlas = AAL_Atlas()
+            return self.aalAtlas
+        elif atlasName == const.YEO:
+            if self.yeoAtlas is None:
+                self.yeoAtlas = YeoAtlas()
+            return self.yeoAtlas
+        else:
+            raise ValueError('Unknown atlas: %s' % atlasName)
+
+
+    def getLabels(self, atlasName, worldCoordinates):
+        """
+        Returns the labels of many points at once
+
+        :param atlasName: one of const.TALAIRACH, const.AAL or const.YEO
+        :param worldCoordinates: (N, 3) array of MNI world coordinates
+        :returns: tuple (N-element array of label indices, list of N label names)
+        """
+        return self.getAtlas(atlasName).getLabels(worldCoordinates)
+
+
 
 class Atlas:
 
     def __init__(self):
         self.labelsMap = {}
-        self.readNifti()
-        self.readLabels()
+        if not self.readCache():
+            self.readNifti()
+            self.readLabels()
+            self.writeCache()
+        self.worldToVoxelMatrix = np.linalg.inv(self.affine)
 
 
     def readNifti(self):
-        if isSlicerPython():
-            self.image = readImageITK(self.volumePath)
-        else:
-            self.data, self.affine = readImageNibabel(self.volumePath)
+        self.data, self.affine = ImageUtils.readImageArray(self.volumePath)
+
+
+    def getCachePaths(self):
+        name = os.path.basename(self.volumePath).split('.')[0]
+        arrayPath = os.path.join(cacheDir, name + '_uint16.npy')
+        sidecarPath = os.path.join(cacheDir, name + '.json')
+        return arrayPath, sidecarPath
+
+
+    def getCacheKey(self):
+        return {'version': CACHE_VERSION,
+                'volumeMTime': os.path.getmtime(self.volumePath),
+                'labelsMTime': os.path.getmtime(self.labelsPath)}
+
+
+    def readCache(self):
+        """
+        Memory-maps the uncompressed copy of the atlas written by a previous session, if it is up to date.
+        The pages of the array are shared by all the processes reading the same atlas.
+
+        :returns: True if the cache could be used
+        """
+        arrayPath, sidecarPath = self.getCachePaths()
+        if not os.path.exists(sidecarPath):
+            return False
+        try:
+            with open(sidecarPath) as f:
+                sidecar = json.load(f)
+            if sidecar['key'] != self.getCacheKey():
+                return False
+            data = np.load(arrayPath, mmap_mode='r')  # the array may be missing or truncated
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+        self.data = data
+        self.affine = np.array(sidecar['affine'])
+        self.labelsMap = dict((int(index), label) for index, label in sidecar['labels'].items())
+        return True
+
+
+    def writeCache(self):
+        """
+        Writes the atlas as a raw uint16 array plus a JSON sidecar holding the affine and the labels.
+        The sidecar is written last, so a partially written cache is never used.
+        """
+        if self.data.min() < 0 or self.data.max() > np.iinfo(np.uint16).max:
+            return
+        arrayPath, sidecarPath = self.getCachePaths()
+        sidecar = {'key': self.getCacheKey(),
+                   'affine': self.affine.tolist(),
+                   'labels': self.labelsMap}
+        try:
+            if not os.path.exists(cacheDir):
+                os.makedirs(cacheDir)
+            for path in sidecarPath, arrayPath:  # os.rename does not overwrite on Windows
+                if os.path.exists(path):
+                    os.remove(path)
+            tempArrayPath = arrayPath + '.%d.tmp' % os.getpid()
+            with open(tempArrayPath, 'wb') as f:
+                np.save(f, self.data.astype(np.uint16))
+            os.rename(tempArrayPath, arrayPath)
+            tempSidecarPath = sidecarPath + '.%d.tmp' % os.getpid()
+            with open(tempSidecarPath, 'w') as f:
+                json.dump(sidecar, f)
+            os.rename(tempSidecarPath, sidecarPath)
+        except (IOError, OSError):
+            pass  # the cache is only an optimization, e.g. the templates may be read-only
 
 
     def getPixelValue(self, worldCoordinates):
-        voxel = self.getVoxelFromWorld(worldCoordinates)
-        if isSlicerPython():
-            return self.image.GetPixel(*voxel)
-        else:
-            voxel = tuple(map(int, voxel))
-            return self.data[voxel]
+
+        return self.getPixelValues([worldCoordinates])[0]
+
+
+    def getPixelValues(self, worldCoordinates):
+        """
+        Returns the atlas values at many points at once. Points outside the atlas get 0.
+
+        :param worldCoordinates: (N, 3) array of world coordinates
+        :returns: N-element array of atlas values
+        """
+        voxels, inside = ImageUtils.getNearestVoxels(worldCoordinates, self.worldToVoxelMatrix, self.data.shape)
+        values = np.zeros(len(voxels), int)
+        i, j, k = voxels[inside].T
+        values[inside] = self.data[i, j, k]
+        return values
 
 
     def getVoxelFromWorld(self, worldCoordinates):
-        if isSlicerPython():
-            return self.image.TransformPhysicalPointToIndex(worldCoordinates)
-        else:
-            coords = np.array(worldCoordinates)
-            worldToVoxelMatrix = np.linalg.inv(self.affine)
-            rot = worldToVoxelMatrix[:3, :3]
-            trans = worldToVoxelMatrix[:3, 3]
-            voxel = np.dot(rot, coords) + trans
-            return np.round(voxel).astype('uint16')
+        voxel = ImageUtils.applyAffine([worldCoordinates], self.worldToVoxelMatrix)[0]
+        return np.round(voxel).astype(int)
+
+
+    def getLabel(self, worldCoordinates):
+        value = int(self.getPixelValue(worldCoordinates))
+        return self.getLabelFromValue(value)
+
+
+    def getLabels(self, worldCoordinates):
+        """
+        Returns the labels of many points at once. Each different value is only looked up once.
+
+        :param worldCoordinates: (N, 3) array of world coordinates
+        :returns: tuple (N-element array of label indices, list of N label names)
+        """
+        values = self.getPixelValues(worldCoordinates)
+        uniqueValues, inverse = np.unique(values, return_inverse=True)
+        uniqueLabels = [self.getLabelFromValue(int(value)) for value in uniqueValues]
+        labels = [uniqueLabels[i] for i in inverse]
+        return values, labels
 
 
 
@@ -120,10 +215,9 @@ class AAL_Atlas(Atlas):
                 self.labelsMap[index] = split[1]
 
 
-    def getLabel(self, worldCoordinates):
-        value = int(self.getPixelValue(worldCoordinates))
+    def getLabelFromValue(self, value):
         if not value:
-            return 'No label found in the atlas for this point'
+            return NO_LABEL
         else:
             return self.labelsMap[value]
 
@@ -145,14 +239,12 @@ class TalairachAtlas(Atlas):
             self.labelsMap[index] = labelNode.text
 
 
-    def getLabel(self, worldCoordinates):
-        value = int(self.getPixelValue(worldCoordinates))
-        label = self.labelsMap[value]
-        labels = label.split('.')
-        if set(labels) == {'*'}:
-            return 'No label found in the atlas for this point'
+    def getLabelFromValue(self, value):
+        label = self.labelsMap.get(value)
+        if label is None or set(label.split('.')) == {'*'}:
+            return NO_LABEL
         else:
-            return self.labelsMap[value]
+            return label
 
 
 
@@ -177,11 +269,9 @@ class YeoAtlas(Atlas):
                 self.labelsMap[index] = split[1]
 
 
-    def getLabel(self, worldCoordinates):
-        value = int(self.getPixelValue(worldCoordinates))
-        label = self.labelsMap[value]
+    def getLabelFromValue(self, value):
         if not value:
-            return 'No label found in the atlas for this point'
+            return NO_LABEL
         else:
             return self.labelsMap[value]
 
@@ -1,10 +1,16 @@
 import os
 import sys
 import csv
+import contextlib
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
 import numpy as np
+import SimpleITK as sitk
 from __main__ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 import CompareVolumes
+import sitkUtils
 
 moduleDir = os.path.dirname(__file__)
 codeDir = os.path.abspath(os.path.join(moduleDir, os.pardir))
@@ -12,7 +18,13 @@ sys.path.insert(0, codeDir)  # So that it comes first in the list
 
 # Epiloc imports
 import PatientModelEpilepsy
+import ImageUtils
 import ElectrodesIO
+import Implant
+import DeformationField
+import TransformGraph
+import ProbeEye
+import Electrode
 import epiloc_constants as const
 import atlaslabels
 
@@ -24,6 +36,8 @@ NORMALIZED = 'Normalized'
 CT_POST_NODE = 'Postoperative CT'
 T1_PRE_NODE = 'Preoperative T1 MRI'
 T1_POST_NODE = 'Postoperative T1 MRI'
+PROBE_EYE_NODE = "Probe's eye"
+INTERACTION_DELAY = 200  # ms, longer than the auto-repeat interval of the spin boxes
 
 
 class EpilocVisualization(ScriptedLoadableModule):
@@ -53,9 +67,21 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
         self.setCustomSlicerSettings()
 
         self.electrodes = []
+        self.implant = None
+        self.electrodesRegistry = None
         self.activeElectrode = None
         self.atlasReader = atlaslabels.AtlasReader()
         self.mniScene = False
+        self.labelsThread = None
+        self.probeEyeThread = None
+        self.labelsTimer = qt.QTimer()
+        self.labelsTimer.setInterval(200)
+        self.labelsTimer.timeout.connect(self.onLabelsTimer)
+        self.pendingElectrode = None
+        self.interactionTimer = qt.QTimer()
+        self.interactionTimer.setSingleShot(True)
+        self.interactionTimer.setInterval(INTERACTION_DELAY)
+        self.interactionTimer.timeout.connect(self.onInteractionTimer)
 
 
     def setPaths(self):
@@ -72,7 +98,7 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
 
     def makeGUI(self):
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
 
         self.loadDataCollapsibleButton = ctk.ctkCollapsibleButton()
         self.loadDataCollapsibleButton.setChecked(True)
@@ -226,7 +252,8 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
             slicer.util.delayDisplay('No XML file was found.', 1500)
             return
 
-        self.loadPatientData(xmlPath)
+        with getLogic().batchSceneChanges():
+            self.loadPatientData(xmlPath)
 
 
     def onLoadPatientMNIData(self):
@@ -240,26 +267,31 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
             slicer.util.delayDisplay('No XML file was found.', 1500)
             return
 
-        csvPath = self.getPatientCSV()
-        if not csvPath:
-            slicer.util.delayDisplay('No CSV file was found.', 1500)
-            return
+        if self.canWarpToMNI():
+            csvPath = None  # the MNI centers are computed from the deformation field
+        else:
+            csvPath = self.getPatientCSV()
+            if not csvPath:
+                slicer.util.delayDisplay('No CSV file was found.', 1500)
+                return
 
-        self.loadPatientMNIData(xmlPath, csvPath)
+        with getLogic().batchSceneChanges():
+            self.loadPatientMNIData(xmlPath, csvPath)
 
 
     def onResetViews(self):
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
         logic.centerSlices((0,0,0), fitSlices=True)  # AC = 0,0,0
         logic.setLinkedControl(True)
         self.activeElectrode = None
-        for electrode in self.electrodes:
-            electrode.show()
-            # electrode.plotsGroupBox.hide()
+        if self.electrodesRegistry is not None:
+            self.electrodesRegistry.showAll()
+        # for electrode in self.electrodes:
+        #     electrode.plotsGroupBox.hide()
 
 
     def updateVolumesFromSelectors(self):
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
         bgVolumeNode = self.bgSelector.currentNode()
         fgVolumeNode = self.fgSelector.currentNode()
         opacity = self.opacitySlider.value
@@ -277,8 +309,9 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
 
     def onReload(self):
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
         logic.closeSlicerScene()
+        logic.removeObservers()
         # super(EpilocVisualizationWidget, self).onReload()
         ScriptedLoadableModuleWidget.onReload(self)
 
@@ -295,8 +328,7 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
         GREEN = 'vtkMRMLColorTableNodeGreen'
         MAGENTA = 'vtkMRMLColorTableNodeMagenta'
 
-        red_logic = slicer.app.layoutManager().sliceWidget("Red").sliceLogic()
-        red_cn = red_logic.GetSliceCompositeNode()
+        red_cn = getLogic().getSliceCompositeNode('Red')
 
         bgImageDisplayNode = slicer.util.getNode(red_cn.GetBackgroundVolumeID()).GetDisplayNode()
         fgImageDisplayNode = slicer.util.getNode(red_cn.GetForegroundVolumeID()).GetDisplayNode()
@@ -311,6 +343,34 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
             fgImageDisplayNode.SetAndObserveColorNodeID(GRAY)
 
 
+    def onLabelsTimer(self):
+        if self.labelsThread is not None and self.labelsThread.is_alive():
+            return
+        self.labelsTimer.stop()
+        if self.activeElectrode is not None:
+            self.activeElectrode.updateLabels()
+
+
+    def scheduleElectrodeUpdate(self, electrode):
+        """
+        Updates the views for an electrode at most once every INTERACTION_DELAY ms.
+        The events arriving in between, e.g. while a spin box arrow is held, are coalesced
+        and only the latest scheduled update is applied.
+        """
+        self.pendingElectrode = electrode
+        if not self.interactionTimer.isActive():
+            self.interactionTimer.start()
+
+
+    def onInteractionTimer(self):
+        electrode = self.pendingElectrode
+        self.pendingElectrode = None
+        if electrode is None:
+            return
+        with getLogic().pausedRendering():
+            electrode.updateViews()
+
+
     def onLayerRevealCheckBox(self):
         if self.layerRevealCheckBox.checked:
             self.layerReveal = CompareVolumes.LayerReveal(width=300, height=300)
@@ -320,12 +380,102 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
 
     ### LOAD DATA ###
+    def startLabelsComputation(self):
+        """
+        Computes the anatomical labels of every plot in a background thread.
+        The labels are shown as soon as the thread finishes.
+        """
+        logic = getLogic()
+        atlasReader = self.atlasReader if self.mniScene else None
+        self.labelsThread = threading.Thread(target=logic.computeElectrodesLabels,
+                                             args=(self.electrodes, self.model.localizationsPath, atlasReader))
+        self.labelsThread.daemon = True
+        self.labelsThread.start()
+        self.labelsTimer.start()
+
+
+    def startProbeEyeComputation(self, volumePath, image, toVolumeMatrix=None, cacheDir=None):
+        """
+        Computes or reads the probe's eye stack of every electrode in a background thread
+
+        :param volumePath: volume resampled along the electrodes
+        :param image: SimpleITK image already read from volumePath, or None if it could not be read
+        :param toVolumeMatrix: 4x4 matrix from the space of the electrodes to the space of the volume
+        """
+        if image is None:
+            return
+        if cacheDir is None:
+            cacheDir = self.model.probeEyeDir
+        self.probeEyeThread = threading.Thread(target=getLogic().computeProbeEyeStacks,
+                                               args=(self.electrodes, volumePath, image, cacheDir, toVolumeMatrix))
+        self.probeEyeThread.daemon = True
+        self.probeEyeThread.start()
+
+
+    def addElectrodesToScene(self):
+        """
+        Adds the widgets of the electrodes and creates all their nodes in one scene batch
+        """
+        for electrode in self.electrodes:
+            button = electrode.getElectrodeButton()
+            if not len(electrode.getValidCenters()):
+                button.setEnabled(False)
+                button.setToolTip('The position of the plots of this electrode is unknown')
+            self.electrodesGroupBox.layout().addWidget(button)
+        with getLogic().batchSceneChanges():
+            for electrode in self.electrodes:
+                self.electrodesAndPlotsLayout.addWidget(electrode.getPlotsGroupBox())
+                electrode.makeAndLoadModels()
+            self.implant.makeMarkups(Electrode.DISTANCE_TO_LABEL)
+        self.electrodesRegistry = ElectrodesRegistry(self.implant)
+
+
+    def canWarpToMNI(self):
+        manifest = self.model.getManifest()
+        return all(manifest.exists(name) for name in ('inverseDeformationFieldPath',
+                                                      'regMatSlicerCtPost2ACPCPath',
+                                                      'regMatSlicerT1Mri2ACPCPath'))
+
+
+    def warpImplantToMNI(self):
+        """
+        Moves the plots from the postoperative CT space to MNI space through the
+        preoperative T1 MRI, using the deformation field computed by the normalization.
+        The centers of the plots outside the field are invalidated.
+        """
+        transformGraph = TransformGraph.TransformGraph(self.model, conventions=(TransformGraph.SLICER,))
+        ctToT1 = transformGraph.getMatrix(TransformGraph.CT_POST, TransformGraph.T1MRI)
+        field = DeformationField.DeformationField.get(self.model.inverseDeformationFieldPath)
+        mniCenters = field.warpPoints(self.implant.centers, ctToT1)
+        outside = ~np.isfinite(mniCenters).all(axis=1)
+        self.implant.centers[:] = mniCenters
+        self.implant.invalidatePlots(np.flatnonzero(outside))
+        if outside.any():
+            message = '%d of %d plots are outside the deformation field and are hidden.'
+            slicer.util.warningDisplay(message % (np.count_nonzero(outside), len(outside)))
+
+
+    def showJoinReport(self, report, csvPath):
+        """
+        Warns about the plots whose MNI center was not found in the localizations file
+
+        :param report: dictionary returned by Implant.joinMNICenters
+        """
+        lines = []
+        if report['electrodesWithoutMNI']:
+            lines.append('Electrodes not found: ' + ', '.join(report['electrodesWithoutMNI']))
+        missingPlots = [(name, number) for name, number in report['plotsWithoutMNI']
+                        if name not in report['electrodesWithoutMNI']]
+        if missingPlots:
+            lines.append('Plots not found: ' + ', '.join('%s %d' % plot for plot in missingPlots))
+        if lines:
+            message = 'Some plots have no MNI coordinates in %s and are hidden.\n\n' % os.path.basename(csvPath)
+            slicer.util.warningDisplay(message + '\n'.join(lines))
+
+
     def getPatientXML(self):
-        if os.path.exists(self.model.xmlVerifiedPath):
-            xmlPath = self.model.xmlVerifiedPath
-        elif os.path.exists(self.model.xmlPath):
-            xmlPath = self.model.xmlPath
-        else:
+        xmlPath = self.model.getManifest().getFirstExisting(['xmlVerifiedPath', 'xmlPath'])
+        if xmlPath is None:
             xmlPath = qt.QFileDialog.getOpenFileName(None,
                                                      'Choose XML electrodes file',
                                                      self.patientDir,
@@ -335,7 +485,7 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
     def getPatientCSV(self):
         # self.setPatientPaths()  #  already done in getPatientXML
-        if os.path.exists(self.model.localizationsPath):
+        if self.model.getManifest().exists('localizationsPath'):
             csvPath = self.model.localizationsPath
         else:
             csvPath = qt.QFileDialog.getOpenFileName(None,
@@ -347,18 +497,19 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
     def loadPatientData(self, xmlPath):
         self.mniScene = False
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
 
         ### LOAD PATIENT DATA ###
         self.loadDataCollapsibleButton.setChecked(False)
         logic.closeSlicerScene()
 
-
-        ## CT-Post
-        successCt, self.ctPostNativeNode = slicer.util.loadVolume(self.model.ctPostPath, returnNode=True)
-        successCtToACPC, self.regMatCtToACPCNode = slicer.util.loadTransform(self.model.regMatSlicerCtPost2ACPCPath, returnNode=True)
-        if successCt:
-            self.ctPostNativeNode.SetName(CT_POST_NODE)
+        ## Volumes are decoded in worker threads while the electrodes are loaded
+        manifest = self.model.getManifest()
+        oldT1Path = self.model.t1mriPrePath.replace('_pre', '')
+        t1PrePath = manifest.getFirstExisting([self.model.t1mriPrePath, oldT1Path])
+        volumesPaths = [path for path in (self.model.ctPostPath, self.model.t1mriPostPath, t1PrePath)
+                        if path is not None and manifest.exists(path)]
+        pendingVolumes = logic.startReadingVolumes(volumesPaths)
 
         ## Load electrodes ##
         for electrode in self.electrodes:
@@ -369,38 +520,37 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
         slicer.util.delayDisplay('Loading electrodes from ' + xmlPath, 1500)
 
         self.electrodes = logic.loadElectrodes(xmlPath)
+        self.implant = Implant.Implant(self.electrodes)
+
+        images = dict(pendingVolumes.get())
+
+        ## CT-Post
+        ctImage = images.get(self.model.ctPostPath)
+        successCt, self.ctPostNativeNode = logic.addVolumeToScene(ctImage, CT_POST_NODE)
+        successCtToACPC, self.regMatCtToACPCNode = slicer.util.loadTransform(self.model.regMatSlicerCtPost2ACPCPath, returnNode=True)
 
         if successCt and successCtToACPC:
             self.ctPostNativeNode.SetAndObserveTransformNodeID(self.regMatCtToACPCNode.GetID())
             ctToACPCMatrix = logic.getMatrixFromTransformNodeID(self.regMatCtToACPCNode.GetID())
-            for electrode in self.electrodes:
-                for plot in electrode.plots:
-                    plot.transformCenter(ctToACPCMatrix)
+            self.implant.transform(ctToACPCMatrix)
+            self.startProbeEyeComputation(self.model.ctPostPath, ctImage, np.linalg.inv(ctToACPCMatrix))
+        else:
+            self.startProbeEyeComputation(self.model.ctPostPath, ctImage)
 
-        for electrode in self.electrodes:
-            self.electrodesGroupBox.layout().addWidget(electrode.getElectrodeButton())
-        for electrode in self.electrodes:
-            self.electrodesAndPlotsLayout.addWidget(electrode.getPlotsGroupBox())
-            electrode.makeAndLoadModels()
+        self.startLabelsComputation()
+
+        self.addElectrodesToScene()
 
 
         ## T1-post
-        successT1Post, self.t1PostNativeNode = slicer.util.loadVolume(self.model.t1mriPostPath, returnNode=True)
-        if successT1Post:
-            self.t1PostNativeNode.SetName(T1_POST_NODE)
+        successT1Post, self.t1PostNativeNode = logic.addVolumeToScene(images.get(self.model.t1mriPostPath), T1_POST_NODE)
         successT1PostToACPC, self.regMatT1PostToACPCNode = slicer.util.loadTransform(self.model.regMatSlicerT1MriPost2ACPCPath, returnNode=True)
         if successT1Post and successT1PostToACPC:
             self.t1PostNativeNode.SetAndObserveTransformNodeID(self.regMatT1PostToACPCNode.GetID())
 
 
         ## T1-pre
-        if os.path.exists(self.model.t1mriPrePath):
-            successT1Pre, self.t1PreNativeNode = slicer.util.loadVolume(self.model.t1mriPrePath, returnNode=True)
-        else:
-            oldT1Path = self.model.t1mriPrePath.replace('_pre', '')
-            successT1Pre, self.t1PreNativeNode = slicer.util.loadVolume(oldT1Path, returnNode=True)
-        if successT1Pre:
-            self.t1PreNativeNode.SetName(T1_PRE_NODE)
+        successT1Pre, self.t1PreNativeNode = logic.addVolumeToScene(images.get(t1PrePath), T1_PRE_NODE)
 
         successT1PreToACPC, self.regMatT1PreToACPCNode = slicer.util.loadTransform(self.model.regMatSlicerT1Mri2ACPCPath, returnNode=True)
         if successT1Pre and successT1PreToACPC:
@@ -417,7 +567,7 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
 
         self.visualizationCollapsibleButton.show()
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
         logic.center3DView()
         logic.centerSlices((0,0,0))
         logic.setLinkedControl(True)
@@ -434,17 +584,22 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
     def loadPatientMNIData(self, xmlPath, csvPath):
         self.mniScene = True
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
 
         ### LOAD PATIENT DATA ###
         self.loadDataCollapsibleButton.setChecked(False)
         logic.closeSlicerScene()
 
-
-        ## CT-Post
-        successCt, self.ctPostMNINode = slicer.util.loadVolume(self.model.regImaCtPost2MNIPath, returnNode=True)
-        if successCt:
-            self.ctPostMNINode.SetName(NORMALIZED + ' ' + CT_POST_NODE)
+        ## Volumes are decoded in worker threads while the electrodes are loaded
+        manifest = self.model.getManifest()
+        oldT1Path = self.model.regImaT1MriPre2MNIPath.replace('_pre', '')
+        unbiasedHeadPath = self.model.regImaT1MriPre2MNIPath.replace('_pre', '_head_unbiased')
+        t1PrePath = manifest.getFirstExisting([self.model.regImaT1MriPre2MNIPath, oldT1Path, unbiasedHeadPath])
+        mniPath = os.path.join(moduleDir, 'Resources/Volumes', 'MNI152_T1_1mm.nii.gz')
+        volumesPaths = [path for path in (self.model.regImaCtPost2MNIPath, self.model.regImaT1MriPost2MNIPath, t1PrePath)
+                        if path is not None and manifest.exists(path)]
+        volumesPaths.append(mniPath)
+        pendingVolumes = logic.startReadingVolumes(volumesPaths)
 
         ## Load electrodes ##
         for electrode in self.electrodes:
@@ -452,39 +607,33 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
             electrode.plotsGroupBox.hide()
         self.electrodes = []
 
-        slicer.util.delayDisplay('Loading electrodes from ' + xmlPath + ' and ' + csvPath, 1500)
         self.electrodes = logic.loadElectrodes(xmlPath)
-        mniElectrodes = logic.loadElectrodes(csvPath)
-        for electrode in self.electrodes:
-            for mniElectrode in mniElectrodes:
-                if mniElectrode.name == electrode.name:
-                    for i in range(len(electrode.plots)):
-                        electrode.plots[i].center = mniElectrode.plots[i].mniCenter
+        self.implant = Implant.Implant(self.electrodes)
+        if csvPath is None:
+            slicer.util.delayDisplay('Loading electrodes from ' + xmlPath + ' and warping them to MNI', 1500)
+            self.warpImplantToMNI()
+        else:
+            slicer.util.delayDisplay('Loading electrodes from ' + xmlPath + ' and ' + csvPath, 1500)
+            mniElectrodes = logic.loadElectrodes(csvPath)
+            self.showJoinReport(self.implant.joinMNICenters(mniElectrodes), csvPath)
 
-        for electrode in self.electrodes:
-            self.electrodesGroupBox.layout().addWidget(electrode.getElectrodeButton())
-        for electrode in self.electrodes:
-            self.electrodesAndPlotsLayout.addWidget(electrode.getPlotsGroupBox())
-            electrode.makeAndLoadModels()
+        self.startLabelsComputation()
+
+        images = dict(pendingVolumes.get())
+        self.startProbeEyeComputation(self.model.regImaCtPost2MNIPath, images.get(self.model.regImaCtPost2MNIPath),
+                                      cacheDir=os.path.join(self.model.probeEyeDir, 'mni'))
+
+        ## CT-Post
+        successCt, self.ctPostMNINode = logic.addVolumeToScene(images.get(self.model.regImaCtPost2MNIPath), NORMALIZED + ' ' + CT_POST_NODE)
+
+        self.addElectrodesToScene()
 
 
         ## T1-post
-        successT1Post, self.t1PostMNINode = slicer.util.loadVolume(self.model.regImaT1MriPost2MNIPath, returnNode=True)
-        if successT1Post:
-            self.t1PostMNINode.SetName(NORMALIZED + ' ' + T1_POST_NODE)
+        successT1Post, self.t1PostMNINode = logic.addVolumeToScene(images.get(self.model.regImaT1MriPost2MNIPath), NORMALIZED + ' ' + T1_POST_NODE)
 
         ## T1-pre
-        if os.path.exists(self.model.regImaT1MriPre2MNIPath):
-            successT1Pre, self.t1PreMNINode = slicer.util.loadVolume(self.model.regImaT1MriPre2MNIPath, returnNode=True)
-        elif os.path.exists(self.model.regImaT1MriPre2MNIPath.replace('_pre', '')):
-            oldT1Path = self.model.regImaT1MriPre2MNIPath.replace('_pre', '')
-            successT1Pre, self.t1PreMNINode = slicer.util.loadVolume(oldT1Path, returnNode=True)
-        elif os.path.exists(self.model.regImaT1MriPre2MNIPath.replace('_pre', '_head_unbiased')):
-            unbiasedHeadPath = self.model.regImaT1MriPre2MNIPath.replace('_pre', '_head_unbiased')
-            successT1Pre, self.t1PreMNINode = slicer.util.loadVolume(unbiasedHeadPath, returnNode=True)
-
-        if successT1Pre:
-            self.t1PreMNINode.SetName(NORMALIZED + ' ' + T1_PRE_NODE)
+        successT1Pre, self.t1PreMNINode = logic.addVolumeToScene(images.get(t1PrePath), NORMALIZED + ' ' + T1_PRE_NODE)
 
 
         """
@@ -496,11 +645,10 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
         """
 
         ## MNI template
-        mniPath = os.path.join(moduleDir, 'Resources/Volumes', 'MNI152_T1_1mm.nii.gz')
-        successMNI, self.mniNode = slicer.util.loadVolume(mniPath, returnNode=True)
+        successMNI, self.mniNode = logic.addVolumeToScene(images.get(mniPath), 'MNI152_T1_1mm')
 
         self.visualizationCollapsibleButton.show()
-        logic = EpilocVisualizationLogic()
+        logic = getLogic()
         logic.center3DView()
         logic.centerSlices((0.5, 2.5, -4))
         logic.setLinkedControl(True)
@@ -519,8 +667,144 @@ class EpilocVisualizationWidget(ScriptedLoadableModuleWidget):
 
 
 
+class ElectrodesRegistry(object):
+    """
+    Maps each electrode to the ID of the display node of its plots model and keeps
+    track of which electrodes are shown, so that only the electrodes whose visibility
+    or selection changes are updated
+    """
+
+    def __init__(self, implant):
+        self.implant = implant
+        self.displayNodesIDs = {}
+        for electrode in implant:
+            if getattr(electrode, 'plotsModel', None) is not None:
+                self.displayNodesIDs[electrode] = electrode.plotsModel.GetDisplayNodeID()
+        self.visibleElectrodes = set(implant)
+        self.selectedElectrode = None
+
+
+    def setState(self, visibleElectrodes, selectedElectrode=None):
+        """
+        :param visibleElectrodes: electrodes that must be shown. The rest are hidden
+        :param selectedElectrode: electrode whose labels are shown with its color
+        """
+        visibleElectrodes = set(visibleElectrodes)
+        changed = visibleElectrodes.symmetric_difference(self.visibleElectrodes)
+        previousSelected = self.selectedElectrode
+        displayNodes = dict((electrode, slicer.mrmlScene.GetNodeByID(self.displayNodesIDs[electrode]))
+                            for electrode in changed if electrode in self.displayNodesIDs)
+        # Only a few nodes change, so each one fires a single modified event. The batch processing
+        # state of the scene would make every scene observer refresh completely
+        nodes = self.implant.markupsNodes + list(displayNodes.values())
+        with getLogic().pausedRendering():
+            wasModified = [node.StartModify() for node in nodes]
+            try:
+                for electrode in changed:
+                    visible = electrode in visibleElectrodes
+                    if electrode in displayNodes:
+                        displayNodes[electrode].SetVisibility(visible)
+                    self.implant.setElectrodeMarkupsState(electrode, visible=visible)
+                if selectedElectrode is not previousSelected:
+                    if previousSelected is not None:
+                        self.implant.setElectrodeMarkupsState(previousSelected, selected=False)
+                    if selectedElectrode is not None:
+                        self.implant.setElectrodeMarkupsState(selectedElectrode, selected=True)
+            finally:
+                for node, modified in zip(nodes, wasModified):
+                    node.EndModify(modified)
+        self.visibleElectrodes = visibleElectrodes
+        self.selectedElectrode = selectedElectrode
+
+
+    def showOnly(self, electrode):
+        self.setState([electrode], selectedElectrode=electrode)
+
+
+    def show(self, electrodes):
+        self.setState(self.visibleElectrodes.union(electrodes), self.selectedElectrode)
+
+
+    def showAll(self):
+        self.setState(self.implant)
+
+
+
+def readImageOrNone(path):
+    try:
+        return path, sitk.ReadImage(path)
+    except RuntimeError:
+        traceback.print_exc()
+        return path, None
+
+
+
+sharedLogic = None
+
+def getLogic():
+    """
+    Returns the logic instance shared by the widget and the electrodes
+    """
+    global sharedLogic
+    if sharedLogic is None:
+        sharedLogic = EpilocVisualizationLogic()
+        sharedLogic.addObservers()
+    return sharedLogic
+
+
+
 class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
 
+    def __init__(self, parent=None):
+        ScriptedLoadableModuleLogic.__init__(self, parent)
+        self.sliceHandles = {}
+        self.sceneObserverTag = None
+
+
+    def addObservers(self):
+        """
+        Clears the cached slice handles when the scene is closed or the layout changes
+        """
+        self.sceneObserverTag = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onSceneOrLayoutChanged)
+        slicer.app.layoutManager().layoutChanged.connect(self.onSceneOrLayoutChanged)
+
+
+    def removeObservers(self):
+        if self.sceneObserverTag is not None:
+            slicer.mrmlScene.RemoveObserver(self.sceneObserverTag)
+            self.sceneObserverTag = None
+            slicer.app.layoutManager().layoutChanged.disconnect(self.onSceneOrLayoutChanged)
+
+
+    def onSceneOrLayoutChanged(self, *args):
+        self.sliceHandles = {}
+
+
+    def getSliceHandles(self, color):
+        """
+        Returns the slice logic, slice node and slice composite node of a slice view.
+        They are cached until the scene is closed or the layout changes.
+
+        :param color: slice color like in const.SLICE_COLOR_XXX
+        :returns: tuple (sliceLogic, sliceNode, compositeNode), or None if the view is not in the layout
+        """
+        if color not in self.sliceHandles:
+            sliceWidget = slicer.app.layoutManager().sliceWidget(color)
+            if sliceWidget is None:
+                return None
+            sliceLogic = sliceWidget.sliceLogic()
+            self.sliceHandles[color] = sliceLogic, sliceLogic.GetSliceNode(), sliceLogic.GetSliceCompositeNode()
+        return self.sliceHandles[color]
+
+
+    def getSliceLogic(self, color):
+        return self.getSliceHandles(color)[0]
+
+
+    def getSliceCompositeNode(self, color):
+        return self.getSliceHandles(color)[2]
+
+
     def addCenteredPushButtonToLayout(self, parent, label, slot, styleSheet=None):
         layout = qt.QHBoxLayout()
         button = qt.QPushButton(label)
@@ -558,13 +842,76 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
         return success, modelNode
 
 
+    def startReadingVolumes(self, paths, numThreads=4):
+        """
+        Starts reading and decoding volumes in worker threads.
+        SimpleITK releases the GIL while reading, so the files are decompressed concurrently.
+
+        :param paths: paths of the volumes
+        :param numThreads: maximum number of worker threads
+        :returns: AsyncResult whose get() returns a list of (path, image) tuples.
+        The image is None if the volume could not be read.
+        """
+        pool = ThreadPool(max(1, min(numThreads, len(paths))))
+        pendingVolumes = pool.map_async(readImageOrNone, paths)
+        pool.close()
+        return pendingVolumes
+
+
+    def addVolumeToScene(self, image, name):
+        """
+        Adds a SimpleITK image to the scene as a scalar volume node.
+        This must be called from the main thread.
+
+        :returns: tuple (success, volumeNode), like slicer.util.loadVolume
+        """
+        if image is None:
+            return False, None
+        if hasattr(sitkUtils, 'PushVolumeToSlicer'):
+            volumeNode = sitkUtils.PushVolumeToSlicer(image, name=name)
+        else:
+            sitkUtils.PushToSlicer(image, name)
+            volumeNode = slicer.util.getNode(name)
+        return volumeNode is not None, volumeNode
+
+
     def loadElectrodes(self, path):
         electrodesReader = ElectrodesIO.ElectrodesReader()
-        if path.lower().endswith('.xml'):
-            electrodes = electrodesReader.getElectrodesFromXML(path)
-        elif path.lower().endswith('.csv'):
-            electrodes = electrodesReader.getElectrodesFromLocalizationsCSV(path)
-        return electrodes
+        return electrodesReader.getElectrodes(path)
+
+
+    def computeElectrodesLabels(self, electrodes, csvPath, atlasReader=None):
+        """
+        Fills the labels table of each electrode. This is meant to be run in a background thread.
+
+        :param electrodes: list of Electrode
+        :param csvPath: path to the anatomical localizations CSV, used for the Talairach labels
+        :param atlasReader: atlaslabels.AtlasReader, only if the electrodes are in MNI space
+        """
+        try:
+            talairachIndex = None
+            if os.path.exists(csvPath):
+                talairachIndex = ElectrodesIO.ElectrodesReader().getTalairachIndex(csvPath)
+            for electrode in electrodes:
+                electrode.computeLabels(talairachIndex, atlasReader)
+        except Exception:
+            traceback.print_exc()
+            for electrode in electrodes:
+                if electrode.labels is None:
+                    electrode.labels = {}
+
+
+    def computeProbeEyeStacks(self, electrodes, volumePath, image, cacheDir, toVolumeMatrix=None):
+        """
+        Sets the probe's eye stack of each electrode. This is meant to be run in a background thread.
+
+        :param image: SimpleITK image read from volumePath, converted to an array only if a stack is not cached
+        """
+        try:
+            getVolume = lambda: ImageUtils.getArrayAndAffineFromITKImage(image)
+            ProbeEye.computeProbeEyeStacks(electrodes, volumePath, cacheDir, toVolumeMatrix, getVolume)
+        except Exception:
+            traceback.print_exc()
 
 
     def center3DView(self, point=None):
@@ -582,7 +929,7 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
     def centerSlices(self, point=None, fitSlices=False):
         self.setAllSlicesToDefault()
         for i, color in enumerate(['Yellow', 'Green', 'Red']):
-            sliceLogic = slicer.app.layoutManager().sliceWidget(color).sliceLogic()
+            sliceLogic = self.getSliceLogic(color)
             if fitSlices:
                 sliceLogic.FitSliceToAll()
             if point is not None:
@@ -616,8 +963,7 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
 
     def setLinkedControl(self, state):
         for color in ['Red', 'Yellow', 'Green']:
-            sliceLogic = slicer.app.layoutManager().sliceWidget(color).sliceLogic()
-            compositeNode = sliceLogic.GetSliceCompositeNode()
+            compositeNode = self.getSliceCompositeNode(color)
             compositeNode.SetLinkedControl(state)
 
 
@@ -661,20 +1007,20 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
 
     def getVTK4x4Matrix(self, matrix):
         vtkMatrix = vtk.vtkMatrix4x4()
-        for row in xrange(4):
-            for col in xrange(4):
-                vtkMatrix.SetElement(row, col, matrix[row,col])
+        vtkMatrix.DeepCopy(np.asarray(matrix, np.float64).ravel())
         return vtkMatrix
 
 
+    def getNumpyMatrix(self, vtkMatrix):
+        elements = 16 * [0]
+        vtkMatrix.DeepCopy(elements, vtkMatrix)
+        return np.array(elements, np.float64).reshape(4, 4)
+
+
     def getMatrixFromTransformNodeID(self, tID):
         vtkMatrix = vtk.vtkMatrix4x4()
         slicer.mrmlScene.GetNodeByID(tID).GetMatrixTransformToWorld(vtkMatrix)
-        matrix = np.identity(4, np.float)
-        for row in xrange(4):
-            for col in xrange(4):
-                matrix[row,col] = vtkMatrix.GetElement(row,col)
-        return matrix
+        return self.getNumpyMatrix(vtkMatrix)
 
 
     def getSliceNodeByColor(self, scene, sliceColor):
@@ -684,6 +1030,9 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
         :param scene: Slicer scene
         :param sliceColor: slice color like in const.SLICE_COLOR_XXX
         """
+        handles = self.getSliceHandles(sliceColor)
+        if handles is not None:
+            return handles[1]
         nodes = scene.GetNodesByClass('vtkMRMLSliceNode')
         for idx in range(nodes.GetNumberOfItems()):
             node = nodes.GetItemAsObject(idx)
@@ -694,8 +1043,7 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
 
     def setBackgroundAndForegroundVolumes(self, bgVolumeNode=None, fgVolumeNode=None, opacity=None):
         for color in ['Red', 'Yellow', 'Green']:
-            sliceLogic = slicer.app.layoutManager().sliceWidget(color).sliceLogic()
-            compositeNode = sliceLogic.GetSliceCompositeNode()
+            compositeNode = self.getSliceCompositeNode(color)
             if bgVolumeNode is not None:
                 compositeNode.SetBackgroundVolumeID(bgVolumeNode.GetID())
             if fgVolumeNode is not None:
@@ -704,15 +1052,91 @@ class EpilocVisualizationLogic(ScriptedLoadableModuleLogic):
                 compositeNode.SetForegroundOpacity(opacity)
 
 
+    def getProbeEyeNode(self):
+        """
+        Returns the hidden single-slice volume that shows the probe's eye slices, creating it if needed
+        """
+        nodeID = getattr(self, 'probeEyeNodeID', None)
+        node = slicer.mrmlScene.GetNodeByID(nodeID) if nodeID is not None else None
+        if node is None:
+            node = slicer.vtkMRMLScalarVolumeNode()
+            node.SetName(PROBE_EYE_NODE)
+            node.SetHideFromEditors(True)
+            slicer.mrmlScene.AddNode(node)
+            node.CreateDefaultDisplayNodes()
+            self.probeEyeNodeID = node.GetID()
+        return node
+
+
+    def showProbeEyeSlice(self, image, ijkToRAS=None, bgVolumeNode=None):
+        """
+        Shows a probe's eye slice as the background of the axial slice view, with the window
+        and level of the background volume. The axial slice view must be in the plane of the slice.
+
+        :param image: 2D array indexed as (row, column), or None to show the background volume again
+        :param ijkToRAS: 4x4 matrix mapping the (column, row, 0) indices of the slice to RAS
+        :param bgVolumeNode: background volume of the other slice views
+        """
+        compositeNode = self.getSliceCompositeNode(const.SLICE_COLOR_AXIAL)
+        if image is None or not hasattr(slicer.util, 'updateVolumeFromArray'):
+            if bgVolumeNode is not None:
+                compositeNode.SetBackgroundVolumeID(bgVolumeNode.GetID())
+            return
+        node = self.getProbeEyeNode()
+        wasModified = node.StartModify()
+        slicer.util.updateVolumeFromArray(node, np.asarray(image)[np.newaxis])
+        node.SetIJKToRASMatrix(self.getVTK4x4Matrix(ijkToRAS))
+        node.EndModify(wasModified)
+        if bgVolumeNode is not None and bgVolumeNode.GetDisplayNode() is not None:
+            bgDisplayNode = bgVolumeNode.GetDisplayNode()
+            displayNode = node.GetDisplayNode()
+            displayNode.SetAutoWindowLevel(False)
+            displayNode.SetWindowLevel(bgDisplayNode.GetWindow(), bgDisplayNode.GetLevel())
+        compositeNode.SetBackgroundVolumeID(node.GetID())
+
+
+    @contextlib.contextmanager
+    def pausedRendering(self):
+        """
+        Context manager that pauses the rendering of all the views, so that they
+        are rendered only once at the end. It can be nested.
+        Rendering cannot be paused in Slicer versions older than 4.11.
+        """
+        pauseRender = hasattr(slicer.app, 'pauseRender')
+        if pauseRender:
+            slicer.app.pauseRender()
+        try:
+            yield
+        finally:
+            if pauseRender:
+                slicer.app.resumeRender()
+
+
+    @contextlib.contextmanager
+    def batchSceneChanges(self):
+        """
+        Context manager that puts the scene in batch processing state and pauses
+        rendering, so that the views are updated only once at the end.
+        It can be nested.
+        """
+        scene = slicer.mrmlScene
+        scene.StartState(scene.BatchProcessState)
+        try:
+            with self.pausedRendering():
+                yield
+        finally:
+            scene.EndState(scene.BatchProcessState)
+
+
     def closeSlicerScene(self):
         # Close scene
-        slicer.mrmlScene.Clear(0)
+        with self.batchSceneChanges():
+            slicer.mrmlScene.Clear(0)
 
 
     def sliceIn3DViewVisibility(self, visibility, sliceColors=['Red', 'Yellow', 'Green']):
         for color in sliceColors:
-            sliceLogic = slicer.app.layoutManager().sliceWidget(color).sliceLogic()
-            sliceNode = sliceLogic.GetSliceNode()
+            sliceNode = self.getSliceNodeByColor(slicer.mrmlScene, color)
             sliceNode.SetSliceVisible(visibility)
 
 
@@ -0,0 +1,77 @@
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+import nibabel as nib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from DeformationField import DeformationField
+from Implant import Implant
+from test_electrode import makeElectrode
+
+SCL_SLOPE_OFFSET = 112
+
+
+def writeField(path, slope, intercept=0):
+    """
+    Writes a field mapping every point to itself shifted by 100 mm,
+    with the given scaling in the header
+    """
+    shape = 10, 10, 10
+    affine = np.identity(4)
+    i, j, k = np.indices(shape)
+    data = np.stack((i, j, k), axis=-1).astype(np.float32) + 100
+    nib.save(nib.Nifti1Image(data.reshape(shape + (1, 3)), affine), path)
+    with open(path, 'r+b') as f:
+        f.seek(SCL_SLOPE_OFFSET)
+        f.write(struct.pack('<ff', slope, intercept))
+
+
+
+class DeformationFieldTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.fieldPath = os.path.join(self.tempDir, 'field.nii')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+
+    def testInvalidSlopeIsIgnored(self):
+        for slope in float('nan'), 0:
+            writeField(self.fieldPath, slope, intercept=5)
+            field = DeformationField(self.fieldPath)
+            np.testing.assert_allclose(field.warpPoints([[1, 2, 3]]), [[101, 102, 103]])
+
+
+    def testSlopeIsApplied(self):
+        writeField(self.fieldPath, 2)
+        field = DeformationField(self.fieldPath)
+        np.testing.assert_allclose(field.warpPoints([[1, 2, 3]]), [[202, 204, 206]])
+
+
+    def testElectrodeOutsideField(self):
+        writeField(self.fieldPath, 1)
+        inside = makeElectrode('A', (1, 1, 1), (1, 0, 0), numPlots=3, spacing=2)
+        outside = makeElectrode('B', (50, 50, 50), (1, 0, 0), numPlots=3, spacing=2)
+        implant = Implant([inside, outside])
+        mniCenters = DeformationField(self.fieldPath).warpPoints(implant.centers)
+        outsideField = ~np.isfinite(mniCenters).all(axis=1)
+        implant.centers[:] = mniCenters
+        implant.invalidatePlots(np.flatnonzero(outsideField))
+        self.assertEqual(len(inside.getValidCenters()), 3)
+        self.assertEqual(len(outside.getValidCenters()), 0)
+        self.assertIsNone(outside.getCenter())
+        self.assertIsNone(outside.getDirection())
+
+
+
+if __name__ == '__main__':
+    unittest.main()
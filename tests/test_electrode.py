@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Electrode import Electrode
+from EpilepsyPlot import EpilepsyPlot
+from Implant import Implant
+
+
+def makeElectrode(name, target, direction, numPlots=5, spacing=3.5):
+    target = np.asarray(target, np.float64)
+    direction = np.asarray(direction, np.float64)
+    plots = [EpilepsyPlot(center=target + i * spacing * direction, number=i + 1) for i in range(numPlots)]
+    return Electrode(name, colorString='1 0 0', plots=plots)
+
+
+def makeMNIElectrode(electrode):
+    plots = []
+    for plot in electrode.plots:
+        mniPlot = EpilepsyPlot(center=None, number=plot.number)
+        mniPlot.mniCenter = plot.center + 100
+        plots.append(mniPlot)
+    return Electrode(electrode.name, plots=plots)
+
+
+
+class InvalidElectrodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.matched = makeElectrode('A', (0, 0, 0), (1, 0, 0))
+        self.partial = makeElectrode('B', (0, 10, 0), (0, 0, 1))
+        self.unmatched = makeElectrode('C', (0, -10, 0), (0, 1, 0))
+        self.implant = Implant([self.matched, self.partial, self.unmatched])
+        mniPartial = makeMNIElectrode(self.partial)
+        mniPartial.plots = mniPartial.plots[:3]
+        self.report = self.implant.joinMNICenters([makeMNIElectrode(self.matched), mniPartial])
+
+
+    def testReport(self):
+        self.assertEqual(self.report['electrodesWithoutMNI'], ['C'])
+        self.assertIn(('B', 4), self.report['plotsWithoutMNI'])
+        self.assertNotIn(('A', 1), self.report['plotsWithoutMNI'])
+
+
+    def testFullyInvalidElectrode(self):
+        electrode = self.unmatched
+        self.assertTrue(np.isnan(electrode.centers).all())
+        self.assertEqual(len(electrode.getValidCenters()), 0)
+        self.assertIsNone(electrode.getTargetPoint())
+        self.assertIsNone(electrode.getEntryPoint())
+        self.assertIsNone(electrode.getCenter())
+        self.assertIsNone(electrode.getDirection())
+        self.assertIsNone(electrode.getLength(screw=True))
+
+
+    def testPartiallyInvalidElectrode(self):
+        electrode = self.partial
+        self.assertEqual(len(electrode.getValidCenters()), 3)
+        np.testing.assert_allclose(electrode.getTargetPoint(), (100, 110, 100))
+        np.testing.assert_allclose(electrode.getEntryPoint(), (100, 110, 107))
+        np.testing.assert_allclose(electrode.getDirection(), (0, 0, -1))
+        self.assertAlmostEqual(electrode.getLength(), 7)
+
+
+    def testTrajectorySamples(self):
+        points, sizes = self.implant.getTrajectorySamples(step=1)
+        self.assertEqual(sizes[2], 0)
+        self.assertTrue(np.isfinite(points).all())
+        self.assertEqual(len(points), sizes.sum())
+
+
+    def testNameLabelPoints(self):
+        points = self.implant.getNameLabelPoints(20)
+        self.assertTrue(np.isfinite(points).all())
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ElectrodesIO import ElectrodesReader
+
+XML = """<?xml version="1.0"?>
+<Electrodes>
+  <Electrode procedure="TP">
+    <Color rgb="1 0 0"/>
+    <Plots>
+      <Plot number="1" x="0" y="0" z="0"/>
+      <Plot number="2" x="0" y="0" z="3.5"/>
+    </Plots>
+  </Electrode>
+</Electrodes>
+"""
+
+
+
+class ElectrodesStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.xmlPath = os.path.join(self.tempDir, 'electrodes.xml')
+        with open(self.xmlPath, 'w') as f:
+            f.write(XML)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+
+    def testPlotNumbersAreIntegers(self):
+        reader = ElectrodesReader()
+        fromXML = reader.getElectrodes(self.xmlPath)
+        self.assertTrue(os.path.exists(reader.getStorePath(self.xmlPath)))
+        fromStore = reader.getElectrodes(self.xmlPath)
+        for electrodes in fromXML, fromStore:
+            self.assertEqual([plot.number for plot in electrodes[0].plots], [1, 2])
+            self.assertTrue(all(isinstance(plot.number, int) for plot in electrodes[0].plots))
+
+
+    def testUnsupportedExtension(self):
+        path = os.path.join(self.tempDir, 'electrodes.txt')
+        open(path, 'w').close()
+        self.assertRaises(ValueError, ElectrodesReader().getElectrodes, path)
+
+
+    def testConcurrentWrites(self):
+        reader = ElectrodesReader()
+        electrodes = reader.getElectrodes(self.xmlPath, useStore=False)
+        pool = ThreadPool(8)
+        try:
+            pool.map(lambda i: reader.writeStore(self.xmlPath, electrodes), range(32))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(sorted(os.listdir(self.tempDir)), ['electrodes.xml', 'electrodes.xml.npz'])
+        self.assertEqual(reader.readStore(self.xmlPath)[0].name, 'TP')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
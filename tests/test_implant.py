@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Implant
+from test_electrode import makeElectrode
+
+
+
+class IntensityProfilesTest(unittest.TestCase):
+
+    def setUp(self):
+        shape = 40, 40, 40
+        i, j, k = np.indices(shape)
+        self.array = (i + 2 * j + 3 * k).astype(np.float32)
+        self.affine = np.identity(4)
+
+
+    def testProfiles(self):
+        electrode = makeElectrode('A', (5, 10, 10), (1, 0, 0), numPlots=3, spacing=2)
+        profiles = Implant.Implant([electrode]).getIntensityProfiles(self.array, self.affine, step=1)
+        profile = profiles['A']
+        self.assertEqual(len(profile), int(electrode.getLength(screw=True)) + 1)
+        # the profile goes from the target point towards the entry point
+        np.testing.assert_allclose(profile[:5], 5 + np.arange(5) + 2 * 10 + 3 * 10)
+
+
+    def testNoImplants(self):
+        self.assertEqual(Implant.getIntensityProfiles([], self.array, self.affine), [])
+
+
+    def testNoElectrodes(self):
+        profiles = Implant.getIntensityProfiles([Implant.Implant([])], self.array, self.affine)
+        self.assertEqual(profiles, [{}])
+
+
+
+if __name__ == '__main__':
+    unittest.main()